@@ -0,0 +1,202 @@
+"""
+Check that the streaming pipeline stays within its memory budget,
+however long the recording.
+
+Synthetic recordings of 1 hour and 8 hours (tones of two "speakers"
+alternating with pauses) are transcribed with `--memory_budget_mb`,
+diarized and summarized, each in a fresh process. The peak RSS of each
+run, above the RSS once everything is imported and set up, must stay
+within the budget, and must not grow by more than `--tolerance` from
+the 1-hour to the 8-hour run. The script exits with a non-zero status
+otherwise.
+
+Whisper is slow on hours of audio, so the real `StreamingTranscriber`
+runs on a stub of the model: it computes the log-mel features of each
+buffer as whisper does, which is what the memory of the audio pipeline
+depends on, and returns a segment every 10 seconds instead of decoding.
+The LLM is stubbed too.
+
+Usage:
+    python benchmarks/memory.py --memory_budget_mb 256
+"""
+import argparse
+import dataclasses
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+import av
+import numpy as np
+from faster_whisper.feature_extractor import FeatureExtractor
+
+from minutes_maker._backends import LLMBackend, Messages
+from minutes_maker._diarizer import Diarizer
+from minutes_maker._profiles import DecodingProfile, select_profile
+from minutes_maker._prompts import EnglishMeetingPrompts
+from minutes_maker._streaming import StreamingTranscriber
+from minutes_maker._summarizer import Summarizer
+from minutes_maker._transcriber import SAMPLING_RATE, Segment
+
+
+class StubTranscriber:
+    """
+    `Transcriber` computing whisper's features without decoding them.
+    """
+
+    def __init__(self) -> None:
+        self.__feature_extractor = FeatureExtractor()
+
+    def resolve_profile(
+        self,
+        profile: str,
+        audio_seconds: float = 0.0,
+        *,
+        deadline_seconds: Optional[float] = None,
+        beam_size: Optional[int] = None,
+    ) -> tuple[str, DecodingProfile]:
+        name, resolved = select_profile(
+            profile, audio_seconds, device="cpu", deadline_seconds=deadline_seconds
+        )
+        if beam_size is not None:
+            resolved = dataclasses.replace(resolved, beam_size=beam_size)
+        return name, resolved
+
+    def detect_language(
+        self, pcm: np.ndarray, *, profile: DecodingProfile, cache: bool = True
+    ) -> tuple[str, float]:
+        return "en", 1.0
+
+    def transcribe(
+        self,
+        pcm: np.ndarray,
+        *,
+        prompt: str = "",
+        profile: DecodingProfile,
+        language: Optional[str] = None,
+    ) -> list[Segment]:
+        self.__feature_extractor(pcm)
+        seconds = len(pcm) / SAMPLING_RATE
+        return [
+            Segment(
+                start=start,
+                end=min(start + 10.0, seconds),
+                text=f"something was said {start:.0f} seconds into the buffer.",
+            )
+            for start in np.arange(0.0, seconds, 10.0)
+        ]
+
+
+class StubBackend(LLMBackend):
+    """
+    Backend answering with the first line of the transcript it is sent.
+    """
+
+    model = "stub"
+
+    def complete(self, messages: Messages, max_tokens: int) -> str:
+        return messages[0]["content"].strip().split("\n")[0][:200]
+
+
+def generate(path: str, hours: float) -> None:
+    """
+    Write a synthetic recording, one minute at a time.
+    """
+    rng = np.random.default_rng(0)
+    with av.open(path, "w") as container:
+        stream = container.add_stream("flac", rate=SAMPLING_RATE, layout="mono")
+        t = np.arange(60 * SAMPLING_RATE) / SAMPLING_RATE
+        for minute in range(int(hours * 60)):
+            # two speakers taking turns every 30 seconds, with pauses
+            pitch = 140.0 if minute % 2 == 0 else 220.0
+            voiced = (t % 30) < 27
+            pcm = np.sin(2 * np.pi * pitch * t) * voiced * 0.3
+            pcm += rng.normal(0, 0.01, len(t))
+            frame = av.AudioFrame.from_ndarray(
+                (pcm * 32767).astype(np.int16).reshape(1, -1),
+                format="s16",
+                layout="mono",
+            )
+            frame.sample_rate = SAMPLING_RATE
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+
+
+def run(path: str, memory_budget_mb: int) -> None:
+    """
+    Process a recording, then print the RSS before processing it
+    and the peak RSS, in KiB.
+    """
+    transcriber = StreamingTranscriber(
+        StubTranscriber(),
+        memory_budget_mb=memory_budget_mb,
+        diarizer=Diarizer(),
+    )
+    summarizer = Summarizer(backend=StubBackend(), max_context_length=12500)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    results = transcriber.convert_and_transcribe(path, profile="speed", language="en")
+    summarizer.summarize(results.transcript, prompts=EnglishMeetingPrompts)
+
+    print(baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def measure(path: str, memory_budget_mb: int) -> tuple[int, int]:
+    command = [
+        sys.executable,
+        __file__,
+        "--run",
+        path,
+        "--memory_budget_mb",
+        str(memory_budget_mb),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    baseline, peak = output.stdout.split()[-2:]
+    return int(baseline), int(peak)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=256,
+        help="memory budget of the audio pipeline in MiB (default: 256)",
+    )
+    argparser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="allowed relative growth of the peak RSS (default: 0.1)",
+    )
+    argparser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+
+    if args.run is not None:
+        run(args.run, args.memory_budget_mb)
+        sys.exit(0)
+
+    budget = args.memory_budget_mb * 1024
+    within_budget = True
+    used: dict[int, int] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for hours in (1, 8):
+            path = os.path.join(tmp_dir, f"{hours}h.flac")
+            generate(path, hours)
+            baseline, peak = measure(path, args.memory_budget_mb)
+            used[hours] = peak - baseline
+            within_budget &= peak <= budget + baseline
+            print(
+                f"{hours}h: peak RSS {peak / 1024:.0f} MiB, "
+                f"{used[hours] / 1024:.0f} MiB above the baseline "
+                f"(budget: {args.memory_budget_mb} MiB)"
+            )
+            os.remove(path)
+
+    growth = used[8] / used[1] - 1
+    print(f"growth from 1h to 8h: {growth:+.1%} (tolerance: {args.tolerance:.0%})")
+    sys.exit(0 if within_budget and growth <= args.tolerance else 1)
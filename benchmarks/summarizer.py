@@ -0,0 +1,171 @@
+"""
+Compare the remote (OpenAI) and local (OpenAI-compatible server)
+summarization backends on the same transcript.
+
+For each backend, `--concurrency` jobs summarize the transcript at the
+same time, as concurrent API requests would, and the script reports
+the end-to-end latency of the jobs and the generation throughput of
+the LLM calls.
+
+Usage:
+    python benchmarks/summarizer.py transcript.txt \\
+        --local_model llama-2-13b-chat --local_api_base http://localhost:8080/v1
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tiktoken
+from dotenv import load_dotenv
+
+from minutes_maker._backends import (
+    BatchingBackend,
+    LLMBackend,
+    LocalBackend,
+    Messages,
+    OpenAIBackend,
+)
+from minutes_maker._prompts import EnglishMeetingPrompts, JapaneseMeetingPrompts
+from minutes_maker._summarizer import Summarizer
+
+
+class TimedBackend(LLMBackend):
+    """
+    Backend recording the latency and the generated tokens of each call.
+    """
+
+    def __init__(self, backend: LLMBackend) -> None:
+        self.model = backend.model
+        self.__backend = backend
+        self.__tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.__lock = threading.Lock()
+        self.calls: list[tuple[float, int]] = []
+
+    def complete(self, messages: Messages, max_tokens: int) -> str:
+        start = time.perf_counter()
+        content = self.__backend.complete(messages, max_tokens)
+        elapsed = time.perf_counter() - start
+
+        with self.__lock:
+            self.calls.append((elapsed, len(self.__tokenizer.encode(content))))
+        return content
+
+
+def run(
+    name: str,
+    backend: LLMBackend,
+    transcript: str,
+    *,
+    concurrency: int,
+    max_context_length: int,
+    prompts,
+) -> None:
+    timed = TimedBackend(backend)
+    summarizer = Summarizer(backend=timed, max_context_length=max_context_length)
+
+    def job() -> float:
+        start = time.perf_counter()
+        summarizer.summarize(transcript, prompts=prompts)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda _: job(), range(concurrency)))
+    wall_time = time.perf_counter() - start
+
+    generated = sum(tokens for _, tokens in timed.calls)
+    print(f"== {name} ({backend.model})")
+    print(f"  jobs                 : {concurrency}")
+    print(f"  LLM calls            : {len(timed.calls)}")
+    print(f"  job latency (median) : {statistics.median(latencies):.2f} s")
+    print(f"  job latency (max)    : {max(latencies):.2f} s")
+    print(
+        "  call latency (median): "
+        f"{statistics.median(elapsed for elapsed, _ in timed.calls):.2f} s"
+    )
+    print(f"  generated tokens     : {generated}")
+    print(f"  throughput           : {generated / wall_time:.1f} tokens/s")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("transcript", type=str, help="path to a transcript")
+    argparser.add_argument(
+        "-l",
+        "--language",
+        type=str,
+        default="ja",
+        choices=["ja", "en"],
+        help="language of the summary (default: ja)",
+    )
+    argparser.add_argument(
+        "--remote_model",
+        type=str,
+        default="gpt-3.5-turbo-16k-0613",
+        help="OpenAI model (default: gpt-3.5-turbo-16k-0613), empty to skip",
+    )
+    argparser.add_argument(
+        "--local_model",
+        type=str,
+        default="",
+        help="model served by the local server (default: skip)",
+    )
+    argparser.add_argument(
+        "--local_api_base",
+        type=str,
+        default="http://localhost:8080/v1",
+        help="base URL of the local server (default: http://localhost:8080/v1)",
+    )
+    argparser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="number of concurrent jobs (default: 4)",
+    )
+    argparser.add_argument(
+        "-b",
+        "--batch_size",
+        type=int,
+        default=1,
+        help="maximum number of LLM requests sent together (default: 1)",
+    )
+    argparser.add_argument(
+        "--max_context_length",
+        type=int,
+        default=12500,
+        help="number of transcript tokens sent at once (default: 12500)",
+    )
+    args = argparser.parse_args()
+
+    with open(args.transcript, "r", encoding="utf-8") as f:
+        transcript = f.read()
+
+    backends: list[tuple[str, LLMBackend]] = []
+    if args.remote_model:
+        backends.append(("remote", OpenAIBackend(model=args.remote_model)))
+    if args.local_model:
+        backends.append(
+            (
+                "local",
+                LocalBackend(model=args.local_model, api_base=args.local_api_base),
+            )
+        )
+
+    for name, backend in backends:
+        if args.batch_size > 1:
+            backend = BatchingBackend(backend, max_batch_size=args.batch_size)
+        run(
+            name,
+            backend,
+            transcript,
+            concurrency=args.concurrency,
+            max_context_length=args.max_context_length,
+            prompts=JapaneseMeetingPrompts
+            if args.language == "ja"
+            else EnglishMeetingPrompts,
+        )
@@ -1,12 +1,37 @@
 import argparse
-from tempfile import TemporaryDirectory
+import os
+import sys
+import time
+from contextlib import AsyncExitStack, nullcontext
+from typing import BinaryIO, Callable, Optional, Union
 
 import uvicorn
-from fastapi import FastAPI, File, Form, UploadFile
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from minutes_maker import MinutesMaker
+from minutes_maker import MinutesMaker, Segment
+from minutes_maker._profiles import PROFILE_NAMES
+from minutes_maker._tracing import (
+    FileSpanExporter,
+    OTLPSpanExporter,
+    SamplingProfiler,
+    propagate,
+    tracer,
+)
+from minutes_maker._transcriber import LANGUAGE_CODES
+from minutes_maker._workdir import WorkDirFullError, WorkDirManager
 
 
 class OutputData(BaseModel):
@@ -14,6 +39,226 @@ class OutputData(BaseModel):
     summary: str
 
 
+# the form of "/minutes_maker", which is parsed by `UploadReceiver`
+# instead of FastAPI, documented for the OpenAPI schema
+UPLOAD_FORM_SCHEMA = {
+    "type": "object",
+    "required": ["file", "language", "category", "content"],
+    "properties": {
+        "file": {"type": "string", "format": "binary"},
+        # the name of the file part is used, kept for older clients
+        "filename": {"type": "string", "deprecated": True},
+        "language": {"type": "string"},
+        "category": {"type": "string"},
+        "content": {"type": "string"},
+        "profile": {"type": "string", "default": "balanced"},
+        "deadline_seconds": {"type": "number"},
+        "source_language": {"type": "string"},
+        "trace_profile": {"type": "boolean", "default": False},
+    },
+}
+
+
+class UploadReceiver:
+    """
+    Receiver of a multipart/form-data body, streaming its "file" part
+    to a work directory.
+
+    The form parsing of Starlette spools files to the system temporary
+    directory before the endpoint runs, so they would be written twice
+    and outside of the managed work directories. Here, the file is
+    written once, to the directory reserved for it, as it arrives.
+
+    Attributes
+    ----------
+    fields : dict[str, str]
+        the other fields of the form.
+    path : Optional[str]
+        path of the received file, None if the form had no "file" part.
+    """
+
+    def __init__(self, boundary: bytes, job_dir: str) -> None:
+        """
+        Initialize UploadReceiver.
+
+        Parameters
+        ----------
+        boundary : bytes
+            boundary of the multipart body.
+        job_dir : str
+            directory to write the file to.
+        """
+        self.fields: dict[str, str] = {}
+        self.path: Optional[str] = None
+        self.__job_dir = job_dir
+
+        self.__file: Optional[BinaryIO] = None
+        self.__pending: list[bytes] = []
+        self.__header_field = b""
+        self.__header_value = b""
+        self.__name = ""
+        self.__filename = ""
+        self.__value = bytearray()
+        # where the data of the current part goes: "file", "field" or None
+        self.__target: Optional[str] = None
+        self.__parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self.__on_part_begin,
+                "on_part_data": self.__on_part_data,
+                "on_part_end": self.__on_part_end,
+                "on_header_field": self.__on_header_field,
+                "on_header_value": self.__on_header_value,
+                "on_header_end": self.__on_header_end,
+                "on_headers_finished": self.__on_headers_finished,
+            },
+        )
+
+    async def receive(self, request: Request) -> None:
+        """
+        Read the body of a request.
+
+        Parameters
+        ----------
+        request : Request
+            the request, whose body has not been read yet.
+        """
+        try:
+            async for chunk in request.stream():
+                self.__parser.write(chunk)
+                # the parser is fast, writing to disk may not be
+                if self.__pending:
+                    await run_in_threadpool(self.__file.writelines, self.__pending)
+                    self.__pending = []
+            self.__parser.finalize()
+        finally:
+            if self.__file is not None:
+                self.__file.close()
+
+    def __on_part_begin(self) -> None:
+        self.__name = ""
+        self.__filename = ""
+        self.__value = bytearray()
+
+    def __on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.__header_field += data[start:end]
+
+    def __on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.__header_value += data[start:end]
+
+    def __on_header_end(self) -> None:
+        if self.__header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self.__header_value)
+            self.__name = options.get(b"name", b"").decode("utf-8")
+            self.__filename = options.get(b"filename", b"").decode("utf-8")
+        self.__header_field = b""
+        self.__header_value = b""
+
+    def __on_headers_finished(self) -> None:
+        # only the first "file" part is kept, other files are ignored
+        if self.__name == "file" and self.path is None:
+            self.__target = "file"
+            self.path = os.path.join(
+                self.__job_dir, os.path.basename(self.__filename) or "upload"
+            )
+            self.__file = open(self.path, "wb")
+        elif self.__name != "file" and not self.__filename:
+            self.__target = "field"
+        else:
+            self.__target = None
+
+    def __on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.__target == "file":
+            self.__pending.append(data[start:end])
+        elif self.__target == "field":
+            self.__value += data[start:end]
+
+    def __on_part_end(self) -> None:
+        if self.__target == "field":
+            self.fields[self.__name] = self.__value.decode("utf-8")
+        self.__target = None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of each HTTP request.
+
+    The span covers the whole request, including the upload of the
+    body, which is recorded as an "upload" span from the first to the
+    last chunk of the body read by the application.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            {
+                "http.method": scope["method"],
+                "http.target": scope["path"],
+                "http.request_content_length": int(headers.get(b"content-length", 0)),
+            },
+        ) as span:
+            upload_started: Optional[int] = None
+            received_bytes = 0
+
+            async def traced_receive() -> Message:
+                nonlocal upload_started, received_bytes
+                if upload_started is None:
+                    upload_started = time.time_ns()
+                message = await receive()
+
+                if message["type"] == "http.request":
+                    received_bytes += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        tracer.record_span(
+                            "upload",
+                            upload_started,
+                            time.time_ns(),
+                            {"http.request_body_bytes": received_bytes},
+                        )
+                return message
+
+            async def traced_send(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, traced_receive, traced_send)
+
+
+def segment_message(segment: Segment, received_seconds: float) -> dict:
+    """
+    Make the message sent to live clients for a transcribed segment.
+
+    Parameters
+    ----------
+    segment : Segment
+        the transcribed segment.
+    received_seconds : float
+        length of the audio received so far.
+
+    Returns
+    -------
+    dict
+        the message, with the lag of the segment behind the stream
+        as "latency".
+    """
+    return {
+        "type": "segment",
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text.strip(),
+        "latency": received_seconds - segment.end,
+    }
+
+
 class MinutesMakerAPI:
     """
     API for Minutes Maker.
@@ -24,14 +269,40 @@ class MinutesMakerAPI:
         FastAPI instance.
     mm : MinutesMaker
         MinutesMaker instance.
+    workdir : WorkDirManager
+        manager of the directories uploaded files are saved to.
 
     Methods
     -------
     minutes_maker
         Minutes Maker API endpoint.
+    minutes_maker_live
+        Minutes Maker live transcription WebSocket endpoint.
     """
 
-    def __init__(self, model: str, cpu_threads: int = 0, num_workers: int = 1):
+    def __init__(
+        self,
+        model: str,
+        cpu_threads: int = 0,
+        num_workers: int = 1,
+        diarize: bool = True,
+        cache_dir: Optional[str] = None,
+        llm_api_base: Optional[str] = None,
+        llm_batch_size: int = 1,
+        max_context_length: Optional[int] = None,
+        max_generation_length: Optional[int] = None,
+        work_dir: Optional[str] = None,
+        tmpfs_dir: Optional[str] = None,
+        tmpfs_threshold_mb: int = 64,
+        disk_quota_mb: int = 0,
+        calibration_file: Optional[str] = None,
+        target_rtf: float = 1.0,
+        memory_budget_mb: int = 0,
+        max_models: int = 2,
+        trace_file: Optional[str] = None,
+        otlp_endpoint: Optional[str] = None,
+        profile_dir: Optional[str] = None,
+    ):
         """
         Initialize MinutesMakerAPI.
 
@@ -45,10 +316,87 @@ class MinutesMakerAPI:
         num_workers : int, optional
             number of workers for whisper inference,
             by default 1 for non-parallel.
+        diarize : bool, optional
+            whether to label the timeline with speakers,
+            by default True.
+        cache_dir : Optional[str], optional
+            directory to persist condensed transcripts and detected
+            languages to, by default None for memory only.
+        llm_api_base : Optional[str], optional
+            base URL of a local OpenAI-compatible server for summarization,
+            by default None for OpenAI API.
+        llm_batch_size : int, optional
+            maximum number of LLM requests of concurrent jobs sent together,
+            by default 1 for no batching.
+        max_context_length : Optional[int], optional
+            number of transcript tokens sent to the LLM at once,
+            by default None for guessing from the model name.
+        max_generation_length : Optional[int], optional
+            maximum number of tokens generated by an LLM call, by default
+            None for half of `max_context_length`, at most 3000.
+        work_dir : Optional[str], optional
+            directory to save uploaded files to,
+            by default None for a directory in the system temporary directory.
+        tmpfs_dir : Optional[str], optional
+            memory-backed directory (e.g. /dev/shm) to save small files to,
+            by default None for always using `work_dir`.
+        tmpfs_threshold_mb : int, optional
+            maximum size of a file saved to `tmpfs_dir`, by default 64.
+        disk_quota_mb : int, optional
+            maximum total size of the files being processed,
+            by default 0 for unlimited.
+        calibration_file : Optional[str], optional
+            calibration of this host written by `--calibrate`,
+            by default None for built-in decoding profiles only.
+        target_rtf : float, optional
+            real-time factor the "auto" decoding profile aims at,
+            by default 1.0.
+        memory_budget_mb : int, optional
+            memory budget of the audio pipeline of a job in MiB, files are
+            transcribed chunk by chunk within it, by default 0 for decoding
+            the whole file at once.
+        max_models : int, optional
+            number of whisper models kept loaded, by default 2.
+        trace_file : Optional[str], optional
+            file to append the spans of the requests to, one JSON object
+            per line, by default None.
+        otlp_endpoint : Optional[str], optional
+            OTLP/HTTP endpoint of an OpenTelemetry collector to send the
+            spans of the requests to, ignored if `trace_file` is given,
+            by default None.
+        profile_dir : Optional[str], optional
+            directory to write the profiles of requests asking for one to,
+            by default None for disabling profiling.
         """
+        if trace_file is not None:
+            tracer.configure(FileSpanExporter(trace_file))
+        elif otlp_endpoint is not None:
+            tracer.configure(OTLPSpanExporter(otlp_endpoint))
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+        self.profile_dir = profile_dir
+
         self.app = FastAPI()
         self.mm = MinutesMaker(
-            model=model, cpu_threads=cpu_threads, num_workers=num_workers
+            model=model,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers,
+            diarize=diarize,
+            cache_dir=cache_dir,
+            llm_api_base=llm_api_base,
+            llm_batch_size=llm_batch_size,
+            max_context_length=max_context_length,
+            max_generation_length=max_generation_length,
+            calibration_file=calibration_file,
+            target_rtf=target_rtf,
+            memory_budget_mb=memory_budget_mb if memory_budget_mb > 0 else None,
+            max_models=max_models,
+        )
+        self.workdir = WorkDirManager(
+            work_dir,
+            tmpfs_dir=tmpfs_dir,
+            tmpfs_threshold_bytes=tmpfs_threshold_mb * 1024**2,
+            quota_bytes=disk_quota_mb * 1024**2 if disk_quota_mb > 0 else None,
         )
 
         self.app.add_api_route(
@@ -56,69 +404,348 @@ class MinutesMakerAPI:
             self.minutes_maker,
             methods=["POST"],
             response_model=OutputData,
+            openapi_extra={
+                "requestBody": {
+                    "required": True,
+                    "content": {"multipart/form-data": {"schema": UPLOAD_FORM_SCHEMA}},
+                }
+            },
         )
+        self.app.add_api_websocket_route("/minutes_maker/live", self.minutes_maker_live)
         self.app.add_middleware(
             CORSMiddleware,
             allow_origins=["*"],
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=["X-Trace-Id"],
         )
+        self.app.add_middleware(TracingMiddleware)
 
-    async def minutes_maker(
-        self,
-        file: UploadFile = File(...),
-        filename: str = Form(...),
-        language: str = Form(...),
-        category: str = Form(...),
-        content: str = Form(...),
-    ) -> OutputData:
+    async def minutes_maker(self, request: Request, response: Response) -> OutputData:
         """
         Minutes Maker API endpoint called when a POST request is sent to
         "/minutes_maker".
 
         This method is composed of the following steps:
 
-        1. Save the file to a temporary directory.
+        1. Reserve space for the body, as told by its Content-Length,
+           then stream the file to a work directory.
         2. Make timeline and summary of the meeting or lecture.
         3. Return timeline and summary.
 
+        The body is a multipart/form-data form with the following fields:
+
+        - file: audio or video file.
+        - filename: ignored, the name of the file part is used instead,
+          accepted for older clients.
+        - language: language of the summary, "en" or "ja".
+        - category: category of the uploaded file, "meeting" or "lecture".
+        - content: topic of the meeting or lecture in the uploaded file.
+        - profile: decoding profile, "speed", "balanced", "accurate" or
+          "auto" to pick one from the length of the file,
+          by default "balanced".
+        - deadline_seconds: time the transcription should take at most,
+          considered by the "auto" profile, optional.
+        - source_language: language spoken in the uploaded file, e.g. "en",
+          optional (detected).
+        - trace_profile: whether to profile this request with a sampling
+          profiler, written to "<profile_dir>/<trace id>.folded",
+          by default false.
+
+        The spans of the request share the trace id returned in the
+        "X-Trace-Id" header.
+
+        Parameters
+        ----------
+        request : Request
+            request, whose body is read by this method.
+        response : Response
+            response, to set the headers of.
+
+        Returns
+        -------
+        OutputData
+            timeline and summary of the uploaded file.
+        """
+        content_type, options = parse_options_header(
+            request.headers.get("content-type", "")
+        )
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise HTTPException(
+                status_code=422, detail="the body must be multipart/form-data."
+            )
+        if not request.headers.get("content-length", "").isdigit():
+            raise HTTPException(
+                status_code=411, detail="the Content-Length header is required."
+            )
+        size = int(request.headers["content-length"])
+
+        with tracer.start_as_current_span("minutes_maker") as span:
+            response.headers["X-Trace-Id"] = span.trace_id
+
+            # 1. reserve space before reading the body, so that uploads which
+            # do not fit wait (or fail) before taking any disk space. The body
+            # is a little larger than the file, which is all that is written
+            async with AsyncExitStack() as job:
+                try:
+                    work_dir = await job.enter_async_context(self.workdir.job(size))
+                except WorkDirFullError as e:
+                    raise HTTPException(status_code=503, detail=str(e))
+
+                receiver = UploadReceiver(options[b"boundary"], work_dir.path)
+                try:
+                    await receiver.receive(request)
+                except MultipartParseError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                form = self.__parse_form(receiver)
+                span.set_attributes(
+                    {
+                        "language": form["language"],
+                        "category": form["category"],
+                        "profile": form["profile"],
+                        "trace_profile": form["trace_profile"],
+                    }
+                )
+
+                profiler: Union[SamplingProfiler, nullcontext] = (
+                    SamplingProfiler(
+                        tracer,
+                        span.trace_id,
+                        os.path.join(self.profile_dir, f"{span.trace_id}.folded"),
+                    )
+                    if form["trace_profile"] and self.profile_dir is not None
+                    else nullcontext()
+                )
+
+                # 2. run off the event loop so that concurrent jobs can overlap
+                with profiler:
+                    timeline, summary = await run_in_threadpool(
+                        propagate(self.__process_upload),
+                        receiver.path,
+                        language=form["language"],
+                        category=form["category"],
+                        content=form["content"],
+                        profile=form["profile"],
+                        deadline_seconds=form["deadline_seconds"],
+                        source_language=form["source_language"],
+                        # the space is given back once the file is decoded
+                        on_input_removed=work_dir.release,
+                    )
+
+        # 3. return timeline and summary
+        return OutputData(timeline=timeline, summary=summary)
+
+    def __parse_form(self, receiver: UploadReceiver) -> dict:
+        """
+        Validate the form of a request to "/minutes_maker".
+
+        Parameters
+        ----------
+        receiver : UploadReceiver
+            receiver of the request body.
+
+        Returns
+        -------
+        dict
+            the fields, with the defaults of the optional ones, and
+            "deadline_seconds" and "trace_profile" converted.
+
+        Raises
+        ------
+        HTTPException
+            422 if a field is missing or invalid.
+        """
+        fields = receiver.fields
+        missing = [
+            name for name in ("language", "category", "content") if name not in fields
+        ]
+        if receiver.path is None:
+            missing.insert(0, "file")
+        if missing:
+            raise HTTPException(
+                status_code=422, detail=f"missing form fields: {', '.join(missing)}."
+            )
+
+        profile = fields.get("profile") or "balanced"
+        if profile not in PROFILE_NAMES + ("auto",):
+            raise HTTPException(
+                status_code=422,
+                detail=f"profile must be one of {PROFILE_NAMES + ('auto',)}.",
+            )
+
+        try:
+            deadline_seconds = (
+                float(fields["deadline_seconds"])
+                if fields.get("deadline_seconds")
+                else None
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=422, detail="deadline_seconds must be a number."
+            )
+
+        source_language = fields.get("source_language") or None
+        if source_language is not None and source_language not in LANGUAGE_CODES:
+            raise HTTPException(
+                status_code=422,
+                detail="source_language must be a language code of whisper, "
+                f"e.g. 'en', but got {source_language}.",
+            )
+
+        trace_profile = fields.get("trace_profile", "").lower() in (
+            "1",
+            "true",
+            "on",
+            "yes",
+        )
+        if trace_profile and self.profile_dir is None:
+            raise HTTPException(
+                status_code=422,
+                detail="profiling is disabled, start the server with --profile_dir.",
+            )
+
+        return {
+            "language": fields["language"],
+            "category": fields["category"],
+            "content": fields["content"],
+            "profile": profile,
+            "deadline_seconds": deadline_seconds,
+            "source_language": source_language,
+            "trace_profile": trace_profile,
+        }
+
+    def __process_upload(
+        self,
+        path: str,
+        *,
+        language: str,
+        category: str,
+        content: str,
+        profile: str,
+        deadline_seconds: Optional[float],
+        source_language: Optional[str],
+        on_input_removed: Callable[[], None],
+    ) -> tuple[str, str]:
+        """
+        Make timeline and summary of an uploaded file.
+
+        The file is removed as soon as it is decoded.
+
         Parameters
         ----------
-        file : UploadFile
-            audio or video file.
-        filename : str
-            filename of the uploaded file.
+        path : str
+            path of the uploaded file, in its work directory.
         language : str
-            language of the uploaded file, "en" or "ja".
+            language of the summary, "en" or "ja".
         category : str
             category of the uploaded file, "meeting" or "lecture".
         content : str
             topic of the meeting or lecture in the uploaded file.
+        profile : str
+            decoding profile.
+        deadline_seconds : Optional[float]
+            time the transcription should take at most.
+        source_language : Optional[str]
+            language spoken in the uploaded file.
+        on_input_removed : Callable[[], None]
+            function called once the uploaded file is removed.
 
         Returns
         -------
-        OutputData
+        tuple[str, str]
             timeline and summary of the uploaded file.
         """
-        # 0. await file.read() to get bytes
-        file = await file.read()
-
-        with TemporaryDirectory() as tempdir:
-            # 1. save the file to a temporary directory
-            with open(f"{tempdir}/{filename}", "wb") as f:
-                f.write(file)
-
-            # 2. make timeline and summary of the meeting or lecture
-            timeline, summary = self.mm(
-                audio_or_video_file_path=f"{tempdir}/{filename}",
+        # the span keeps the worker thread attributed to the request
+        # for the sampling profiler
+        with tracer.start_as_current_span(
+            "process_upload", {"file.bytes": os.path.getsize(path)}
+        ):
+            return self.mm(
+                audio_or_video_file_path=path,
                 language=language,
                 category=category,
                 content=content,
+                profile=profile,
+                deadline_seconds=deadline_seconds,
+                source_language=source_language,
+                remove_input=True,
+                on_input_removed=on_input_removed,
             )
 
-        # 3. return timeline and summary
-        return OutputData(timeline=timeline, summary=summary)
+    async def minutes_maker_live(self, websocket: WebSocket) -> None:
+        """
+        Minutes Maker live transcription endpoint called when a WebSocket
+        connects to "/minutes_maker/live".
+
+        The protocol is as follows:
+
+        1. The client sends a JSON text message with "language",
+           "category", "content" (as in "/minutes_maker"), and optionally
+           "encoding" ("pcm_s16le" or "opus"), "sample_rate", "profile"
+           and "source_language".
+        2. The client sends the audio as binary messages, each message
+           being raw 16-bit PCM or a single Opus packet. The server
+           replies with {"type": "segment", ...} messages as soon as
+           segments of the transcript become stable.
+        3. The client sends any text message (e.g. "end") to end the
+           stream. The server sends the remaining segments and
+           {"type": "result", "timeline": ..., "summary": ...}, and closes
+           the connection.
+
+        Parameters
+        ----------
+        websocket : WebSocket
+            the WebSocket connection.
+        """
+        await websocket.accept()
+
+        try:
+            config = await websocket.receive_json()
+            session = self.mm.live_session(
+                language=config["language"],
+                category=config["category"],
+                content=config.get("content", ""),
+                encoding=config.get("encoding", "pcm_s16le"),
+                sample_rate=int(config.get("sample_rate", 16000)),
+                profile=config.get("profile", "balanced"),
+                source_language=config.get("source_language") or None,
+            )
+        except WebSocketDisconnect:
+            return
+        except (KeyError, ValueError, TypeError) as e:
+            await websocket.close(code=1008, reason=f"invalid config: {e}")
+            return
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is None:
+                    break
+
+                # decoding steps run in the threadpool,
+                # frames keep arriving in the meantime
+                segments = await run_in_threadpool(session.feed, message["bytes"])
+                for segment in segments:
+                    await websocket.send_json(
+                        segment_message(segment, session.received_seconds)
+                    )
+
+            # the transcript is done but for the last window,
+            # so the summary follows shortly after the end of the stream
+            segments, results, summary = await run_in_threadpool(session.close)
+            for segment in segments:
+                await websocket.send_json(
+                    segment_message(segment, session.received_seconds)
+                )
+            await websocket.send_json(
+                {"type": "result", "timeline": results.timeline, "summary": summary}
+            )
+            await websocket.close()
+        except WebSocketDisconnect:
+            return
 
 
 if __name__ == "__main__":
@@ -144,6 +771,127 @@ if __name__ == "__main__":
         default=1,
         help="number of workers for whisper inference (default: 1 for non-parallel)",
     )
+    argparser.add_argument(
+        "--disable_diarization",
+        action="store_true",
+        help="do not label the timeline with speakers",
+    )
+    argparser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="directory to persist condensed transcripts and detected languages to, "
+        "at most 1024 of each (default: memory only)",
+    )
+    argparser.add_argument(
+        "--llm_api_base",
+        type=str,
+        default=None,
+        help="base URL of a local OpenAI-compatible server for summarization "
+        "(default: OpenAI API)",
+    )
+    argparser.add_argument(
+        "--llm_batch_size",
+        type=int,
+        default=1,
+        help="maximum number of LLM requests sent together (default: 1)",
+    )
+    argparser.add_argument(
+        "--max_context_length",
+        type=int,
+        default=None,
+        help="number of transcript tokens sent to the LLM at once "
+        "(default: guessed from the model name)",
+    )
+    argparser.add_argument(
+        "--max_generation_length",
+        type=int,
+        default=None,
+        help="maximum number of tokens generated by an LLM call "
+        "(default: half of --max_context_length, at most 3000)",
+    )
+    argparser.add_argument(
+        "--work_dir",
+        type=str,
+        default=None,
+        help="directory to save uploaded files to "
+        "(default: minutes-maker in the system temporary directory)",
+    )
+    argparser.add_argument(
+        "--tmpfs_dir",
+        type=str,
+        default=None,
+        help="memory-backed directory (e.g. /dev/shm) to save small files to "
+        "(default: always use --work_dir)",
+    )
+    argparser.add_argument(
+        "--tmpfs_threshold_mb",
+        type=int,
+        default=64,
+        help="maximum size of a file saved to --tmpfs_dir in MiB (default: 64)",
+    )
+    argparser.add_argument(
+        "--disk_quota_mb",
+        type=int,
+        default=0,
+        help="maximum total size of the files being processed in MiB "
+        "(default: 0 for unlimited)",
+    )
+    argparser.add_argument(
+        "--calibrate",
+        type=str,
+        default=None,
+        metavar="FIXTURE",
+        help="benchmark the decoding profiles on a short recording with speech, "
+        "write the result to --calibration_file and exit",
+    )
+    argparser.add_argument(
+        "--calibration_file",
+        type=str,
+        default="calibration.json",
+        help="calibration of this host, used if it exists "
+        "(default: calibration.json)",
+    )
+    argparser.add_argument(
+        "--target_rtf",
+        type=float,
+        default=1.0,
+        help='real-time factor the "auto" decoding profile aims at (default: 1.0)',
+    )
+    argparser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=0,
+        help="memory budget of the audio pipeline of a job in MiB, files are "
+        "transcribed chunk by chunk within it (default: 0 for whole files)",
+    )
+    argparser.add_argument(
+        "--max_models",
+        type=int,
+        default=2,
+        help="number of whisper models kept loaded (default: 2)",
+    )
+    argparser.add_argument(
+        "--trace_file",
+        type=str,
+        default=None,
+        help="file to append the spans of the requests to as JSON lines "
+        "(default: no tracing)",
+    )
+    argparser.add_argument(
+        "--otlp_endpoint",
+        type=str,
+        default=None,
+        help="OTLP/HTTP endpoint of an OpenTelemetry collector to send the spans "
+        "of the requests to, e.g. http://localhost:4318 (default: no tracing)",
+    )
+    argparser.add_argument(
+        "--profile_dir",
+        type=str,
+        default=None,
+        help="directory to write the profiles of requests sent with "
+        "trace_profile=true to (default: profiling disabled)",
+    )
     argparser.add_argument(
         "-p",
         "--port",
@@ -153,7 +901,38 @@ if __name__ == "__main__":
     )
     args = argparser.parse_args()
 
+    if args.calibrate is not None:
+        mm = MinutesMaker(
+            model=args.model,
+            cpu_threads=args.cpu_threads,
+            num_workers=args.num_workers,
+            diarize=False,
+        )
+        mm.calibrate(args.calibrate).save(args.calibration_file)
+        sys.exit(0)
+
     mm_api = MinutesMakerAPI(
-        model=args.model, cpu_threads=args.cpu_threads, num_workers=args.num_workers
+        model=args.model,
+        cpu_threads=args.cpu_threads,
+        num_workers=args.num_workers,
+        diarize=not args.disable_diarization,
+        cache_dir=args.cache_dir,
+        llm_api_base=args.llm_api_base,
+        llm_batch_size=args.llm_batch_size,
+        max_context_length=args.max_context_length,
+        max_generation_length=args.max_generation_length,
+        work_dir=args.work_dir,
+        tmpfs_dir=args.tmpfs_dir,
+        tmpfs_threshold_mb=args.tmpfs_threshold_mb,
+        disk_quota_mb=args.disk_quota_mb,
+        calibration_file=args.calibration_file
+        if os.path.exists(args.calibration_file)
+        else None,
+        target_rtf=args.target_rtf,
+        memory_budget_mb=args.memory_budget_mb,
+        max_models=args.max_models,
+        trace_file=args.trace_file,
+        otlp_endpoint=args.otlp_endpoint,
+        profile_dir=args.profile_dir,
     )
     uvicorn.run(mm_api.app, host="0.0.0.0", port=args.port)
@@ -1,4 +1,5 @@
+from ._transcriber import Segment
 from .minutes_maker import MinutesMaker
 
-__all__ = ["MinutesMaker"]
+__all__ = ["MinutesMaker", "Segment"]
 __version__ = "0.1.0"
@@ -0,0 +1,406 @@
+import logging
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Union
+
+import openai
+
+from ._tracing import Span, tracer
+
+Messages = list[dict[str, str]]
+
+
+def _gather(
+    futures: list[Future], return_exceptions: bool
+) -> list[Union[str, Exception]]:
+    """
+    Wait for the completions of a batch, each request failing on its own.
+
+    Parameters
+    ----------
+    futures : list[Future]
+        The futures of the requests.
+    return_exceptions : bool
+        Whether the exception of a failed request takes the place of its
+        content, instead of being raised once all requests are done.
+
+    Returns
+    -------
+    list[Union[str, Exception]]
+        The content, or the exception, of each request.
+    """
+    results: list[Union[str, Exception]] = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
+
+
+class LLMBackend(ABC):
+    """
+    Base class of the chat completion backends used by `Summarizer`.
+
+    Attributes
+    ----------
+    model : str
+        The name of the model served by the backend.
+    """
+
+    model: str
+
+    @abstractmethod
+    def complete(self, messages: Messages, max_tokens: int) -> str:
+        """
+        Generate a chat completion.
+
+        Parameters
+        ----------
+        messages : Messages
+            The chat messages, in the OpenAI format.
+        max_tokens : int
+            The maximum number of tokens to generate.
+
+        Returns
+        -------
+        str
+            The content of the generated message.
+        """
+
+    def complete_batch(
+        self,
+        batch: list[Messages],
+        max_tokens: int,
+        spans: Optional[list[Optional[Span]]] = None,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Union[str, Exception]]:
+        """
+        Generate chat completions of several independent conversations.
+
+        Backends that can process prompts together should override this,
+        the default implementation completes them one by one. A failed
+        conversation never fails the others.
+
+        Parameters
+        ----------
+        batch : list[Messages]
+            The chat messages of each conversation.
+        max_tokens : int
+            The maximum number of tokens to generate per conversation.
+        spans : Optional[list[Optional[Span]]], optional
+            The span of the caller of each conversation, which `complete`
+            records on, by default None (the current span).
+        return_exceptions : bool, optional
+            Whether the exception of a failed conversation takes the place
+            of its content, by default False (the first one is raised).
+
+        Returns
+        -------
+        list[Union[str, Exception]]
+            The content of the generated messages (or the exceptions),
+            in the order of `batch`.
+        """
+        if spans is None:
+            spans = [tracer.current_span()] * len(batch)
+
+        results: list[Union[str, Exception]] = []
+        for messages, span in zip(batch, spans):
+            with tracer.use_span(span):
+                try:
+                    results.append(self.complete(messages, max_tokens))
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results.append(e)
+        return results
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Backend calling the OpenAI chat completion API.
+
+    Transient errors (rate limits, timeouts, unavailable servers) are
+    retried with exponential backoff, and the retries are recorded on
+    the current span.
+    """
+
+    max_retries = 3
+
+    def __init__(self, model: str = "gpt-3.5-turbo-16k-0613") -> None:
+        """
+        Initialize the backend and set the OpenAI API key.
+
+        Parameters
+        ----------
+        model : str, optional
+            The OpenAI model to be used,
+            by default "gpt-3.5-turbo-16k-0613".
+        """
+        self.model = model
+
+        openai.organization = os.getenv("OPENAI_ORGANIZATION", "")
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+
+    def complete(self, messages: Messages, max_tokens: int) -> str:
+        span = tracer.current_span()
+        for retries in range(self.max_retries + 1):
+            try:
+                response = self._create(messages, max_tokens)
+                break
+            except (
+                openai.error.APIConnectionError,
+                openai.error.RateLimitError,
+                openai.error.ServiceUnavailableError,
+                openai.error.Timeout,
+            ) as e:
+                if retries == self.max_retries:
+                    raise
+                logging.warning(f"LLM request failed ({e}), retrying...")
+                if span is not None:
+                    span.set_attribute("llm.retries", retries + 1)
+                    span.add_event("retry", {"error": type(e).__name__})
+                time.sleep(2**retries)
+
+        if span is not None and "usage" in response:
+            span.set_attributes(
+                {
+                    "llm.usage.prompt_tokens": response["usage"]["prompt_tokens"],
+                    "llm.usage.completion_tokens": response["usage"][
+                        "completion_tokens"
+                    ],
+                }
+            )
+        return response["choices"][0]["message"]["content"]
+
+    def complete_batch(
+        self,
+        batch: list[Messages],
+        max_tokens: int,
+        spans: Optional[list[Optional[Span]]] = None,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Union[str, Exception]]:
+        if spans is None:
+            spans = [tracer.current_span()] * len(batch)
+
+        # each request records its retries and usage on its caller's span
+        def complete(messages: Messages, span: Optional[Span]) -> str:
+            with tracer.use_span(span):
+                return self.complete(messages, max_tokens)
+
+        # the API has no batched chat endpoint, but requests are independent
+        with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+            futures = [
+                executor.submit(complete, messages, span)
+                for messages, span in zip(batch, spans)
+            ]
+        return _gather(futures, return_exceptions)
+
+    def _create(self, messages: Messages, max_tokens: int) -> dict:
+        return openai.ChatCompletion.create(
+            model=self.model, max_tokens=max_tokens, messages=messages
+        )
+
+
+class LocalBackend(OpenAIBackend):
+    """
+    Backend calling a local, OpenAI-compatible chat completion server,
+    such as the llama.cpp server or vLLM, so that transcripts never
+    leave the premises.
+
+    Such servers batch concurrent requests on their side (continuous
+    batching), so `complete_batch` sends all requests of a batch at
+    the same time, as separate requests.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_base: str = "http://localhost:8080/v1",
+        *,
+        api_key: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the backend.
+
+        Parameters
+        ----------
+        model : str
+            The name of the model served by the local server.
+        api_base : str, optional
+            The base URL of the server,
+            by default "http://localhost:8080/v1".
+        api_key : Optional[str], optional
+            The API key of the server, by default None
+            (`LOCAL_LLM_API_KEY` environment variable or a dummy key).
+        """
+        self.model = model
+        self.__api_base = api_base
+        self.__api_key = api_key or os.getenv("LOCAL_LLM_API_KEY", "local")
+
+    def _create(self, messages: Messages, max_tokens: int) -> dict:
+        # pass the endpoint per request not to touch the global settings
+        # used by `OpenAIBackend`
+        return openai.ChatCompletion.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=messages,
+            api_base=self.__api_base,
+            api_key=self.__api_key,
+            organization="",
+        )
+
+
+class BatchingBackend(LLMBackend):
+    """
+    Backend coalescing the requests of concurrent jobs into batches.
+
+    Each call of `complete` is queued, and a dispatcher thread collects
+    up to `max_batch_size` queued requests, waiting at most
+    `max_wait_seconds` for a batch to fill up, and hands the batch to
+    the wrapped backend's `complete_batch` on a worker thread. Up to
+    `max_concurrent_batches` batches are in flight at once, requests
+    arriving meanwhile are collected into the next batch instead of
+    waiting for the previous one to return. The size of the batch a
+    request was sent in is recorded on the span of the caller.
+
+    OpenAI-compatible chat endpoints take a single conversation per
+    request, so a "batch" is a set of requests sent at the same time,
+    which the local server processes together with continuous batching
+    (llama.cpp server with parallel slots, vLLM). Batching bounds and
+    aligns the load on the server, the forward passes are shared by the
+    server, not by this backend.
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        *,
+        max_batch_size: int = 8,
+        max_wait_seconds: float = 0.05,
+        max_concurrent_batches: int = 4,
+    ) -> None:
+        """
+        Initialize the backend and start the dispatcher thread.
+
+        Parameters
+        ----------
+        backend : LLMBackend
+            The backend to send the batches to.
+        max_batch_size : int, optional
+            The maximum number of requests in a batch, by default 8.
+        max_wait_seconds : float, optional
+            How long to wait for a batch to fill up, by default 0.05.
+        max_concurrent_batches : int, optional
+            The maximum number of batches in flight, by default 4.
+        """
+        self.model = backend.model
+        self.__backend = backend
+        self.__max_batch_size = max_batch_size
+        self.__max_wait_seconds = max_wait_seconds
+        self.__requests: queue.Queue[
+            tuple[Messages, int, Future, Optional[Span]]
+        ] = queue.Queue()
+        self.__slots = threading.BoundedSemaphore(max_concurrent_batches)
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+
+        threading.Thread(target=self.__dispatch, daemon=True).start()
+
+    def complete(self, messages: Messages, max_tokens: int) -> str:
+        future: Future = Future()
+        self.__requests.put((messages, max_tokens, future, tracer.current_span()))
+        return future.result()
+
+    def complete_batch(
+        self,
+        batch: list[Messages],
+        max_tokens: int,
+        spans: Optional[list[Optional[Span]]] = None,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Union[str, Exception]]:
+        if spans is None:
+            spans = [tracer.current_span()] * len(batch)
+
+        futures: list[Future] = []
+        for messages, span in zip(batch, spans):
+            futures.append(Future())
+            self.__requests.put((messages, max_tokens, futures[-1], span))
+        return _gather(futures, return_exceptions)
+
+    def __dispatch(self) -> None:
+        """
+        Collect queued requests into batches and send them, forever.
+        """
+        while True:
+            batch = [self.__requests.get()]
+            while len(batch) < self.__max_batch_size:
+                try:
+                    batch.append(self.__requests.get(timeout=self.__max_wait_seconds))
+                except queue.Empty:
+                    break
+
+            # all batches in flight, requests arriving meanwhile
+            # join this batch
+            self.__slots.acquire()
+            while len(batch) < self.__max_batch_size:
+                try:
+                    batch.append(self.__requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            # requests with different `max_tokens` cannot share a call
+            groups = [
+                [request for request in batch if request[1] == max_tokens]
+                for max_tokens in {max_tokens for _, max_tokens, _, _ in batch}
+            ]
+            for i, requests in enumerate(groups):
+                # the first group uses the slot acquired above
+                if i > 0:
+                    self.__slots.acquire()
+                self.__executor.submit(self.__send, requests)
+
+    def __send(
+        self, requests: list[tuple[Messages, int, Future, Optional[Span]]]
+    ) -> None:
+        """
+        Send a batch of requests sharing `max_tokens`, resolve their
+        futures and free the slot of the batch.
+        """
+        logging.info(f"sending a batch of {len(requests)} LLM requests.")
+        for _, _, _, span in requests:
+            if span is not None:
+                span.set_attribute("llm.batch_size", len(requests))
+        try:
+            # the dispatcher's context is not the callers', pass their spans,
+            # and a failed request must only fail its own caller
+            results = self.__backend.complete_batch(
+                [messages for messages, _, _, _ in requests],
+                requests[0][1],
+                spans=[span for _, _, _, span in requests],
+                return_exceptions=True,
+            )
+        except Exception as e:
+            # the backend itself failed, not a single request
+            for _, _, future, _ in requests:
+                future.set_exception(e)
+            return
+        finally:
+            self.__slots.release()
+
+        for (_, _, future, _), result in zip(requests, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def hash_key(*parts: str) -> str:
+    """
+    Make a cache key from the given strings.
+
+    Parameters
+    ----------
+    *parts : str
+        The strings identifying the cached value.
+
+    Returns
+    -------
+    str
+        The hex digest of the strings.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class JsonCache:
+    """
+    A thread-safe LRU cache of JSON-serializable values.
+
+    Values are kept in memory, and are also written to `directory`
+    (one JSON file per key) if it is given, so that they survive
+    restarts of the server. The directory is bounded as well: the least
+    recently used files are removed once there are more than
+    `max_disk_entries` of them.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_entries: int = 128,
+        max_disk_entries: int = 1024,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        directory : Optional[str], optional
+            The directory to persist the values to,
+            by default None (memory only).
+        max_entries : int, optional
+            The maximum number of values kept in memory, by default 128.
+        max_disk_entries : int, optional
+            The maximum number of values kept in `directory`,
+            by default 1024.
+        """
+        self.__directory = directory
+        self.__max_entries = max_entries
+        self.__max_disk_entries = max_disk_entries
+        self.__entries: OrderedDict[str, Any] = OrderedDict()
+        self.__lock = threading.Lock()
+
+        # counted again when evicting, other processes may share `directory`
+        self.__disk_entries = 0
+        if self.__directory is not None:
+            os.makedirs(self.__directory, exist_ok=True)
+            self.__disk_entries = len(self.__disk_paths())
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a value from the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key of the value.
+
+        Returns
+        -------
+        Optional[Any]
+            The value, or None if it is not cached.
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                return self.__entries[key]
+
+        if self.__directory is None:
+            return None
+
+        try:
+            with open(self.__path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # the modification time orders the files for eviction
+            os.utime(self.__path(key))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logging.warning(f"ignoring unreadable cache entry {key}.")
+            return None
+
+        self.__remember(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Put a value into the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key of the value.
+        value : Any
+            A JSON-serializable value.
+        """
+        self.__remember(key, value)
+
+        if self.__directory is None:
+            return
+
+        # write to a temporary file first so that readers never see
+        # a partially written entry
+        path = self.__path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        created = not os.path.exists(path)
+        os.replace(temp_path, path)
+
+        if created:
+            self.__evict()
+
+    def __remember(self, key: str, value: Any) -> None:
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+
+    def __evict(self) -> None:
+        with self.__lock:
+            self.__disk_entries += 1
+            if self.__disk_entries <= self.__max_disk_entries:
+                return
+
+            paths = self.__disk_paths()
+            mtimes = {}
+            for path in paths:
+                try:
+                    mtimes[path] = os.path.getmtime(path)
+                except FileNotFoundError:
+                    pass
+            evicted = sorted(mtimes, key=mtimes.get)[
+                : max(0, len(mtimes) - self.__max_disk_entries)
+            ]
+            for path in evicted:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.__disk_entries = len(mtimes) - len(evicted)
+            if evicted:
+                logging.info(f"removed {len(evicted)} old cache entries.")
+
+    def __disk_paths(self) -> list[str]:
+        return [
+            entry.path
+            for entry in os.scandir(self.__directory)
+            if entry.name.endswith(".json")
+        ]
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.__directory, f"{key}.json")
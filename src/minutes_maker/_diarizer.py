@@ -0,0 +1,478 @@
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class SpeakerTurn:
+    start: float
+    end: float
+    speaker: str
+
+
+class EmbeddingBackend(ABC):
+    """
+    Base class of the speaker embedding backends used by `Diarizer`.
+
+    A backend maps fixed-length windows of mono PCM to fixed-length
+    vectors. Vectors of the same speaker are expected to be close
+    in cosine distance.
+    """
+
+    @abstractmethod
+    def embed(self, windows: np.ndarray, sampling_rate: int) -> np.ndarray:
+        """
+        Compute speaker embeddings of the given windows.
+
+        Parameters
+        ----------
+        windows : np.ndarray
+            float32 PCM windows of shape (n_windows, window_samples).
+        sampling_rate : int
+            The sampling rate of the PCM.
+
+        Returns
+        -------
+        np.ndarray
+            Embeddings of shape (n_windows, embedding_dim).
+        """
+
+
+class SpectralEmbeddingBackend(EmbeddingBackend):
+    """
+    Offline, CPU-only embedding backend based on log-mel statistics.
+
+    Each window is described by the mean and the standard deviation
+    of its log-mel spectrogram. It is far less discriminative than
+    a neural speaker encoder, but needs nothing beyond numpy.
+    """
+
+    def __init__(
+        self,
+        n_mels: int = 40,
+        *,
+        frame_seconds: float = 0.025,
+        hop_seconds: float = 0.010,
+    ) -> None:
+        """
+        Initialize the backend.
+
+        Parameters
+        ----------
+        n_mels : int, optional
+            The number of mel bands, by default 40.
+        frame_seconds : float, optional
+            The length of an STFT frame, by default 0.025.
+        hop_seconds : float, optional
+            The hop between STFT frames, by default 0.010.
+        """
+        self.__n_mels = n_mels
+        self.__frame_seconds = frame_seconds
+        self.__hop_seconds = hop_seconds
+        self.__filterbanks: dict[int, np.ndarray] = {}
+
+    def embed(self, windows: np.ndarray, sampling_rate: int) -> np.ndarray:
+        frame_length = int(self.__frame_seconds * sampling_rate)
+        hop_length = int(self.__hop_seconds * sampling_rate)
+        n_fft = 1 << (frame_length - 1).bit_length()
+
+        # (n_windows, n_frames, frame_length) view without copying the PCM
+        frames = np.lib.stride_tricks.sliding_window_view(
+            windows, frame_length, axis=1
+        )[:, ::hop_length]
+        spectrum = np.abs(
+            np.fft.rfft(frames * np.hanning(frame_length), n=n_fft, axis=-1)
+        )
+        log_mel = np.log(
+            spectrum**2 @ self.__filterbank(sampling_rate, n_fft).T + 1e-10
+        )
+
+        return np.concatenate(
+            [log_mel.mean(axis=1), log_mel.std(axis=1)], axis=1
+        ).astype(np.float32)
+
+    def __filterbank(self, sampling_rate: int, n_fft: int) -> np.ndarray:
+        """
+        Build (and cache) a triangular mel filterbank.
+
+        Parameters
+        ----------
+        sampling_rate : int
+            The sampling rate of the PCM.
+        n_fft : int
+            The FFT size.
+
+        Returns
+        -------
+        np.ndarray
+            The filterbank of shape (n_mels, n_fft // 2 + 1).
+        """
+        if n_fft in self.__filterbanks:
+            return self.__filterbanks[n_fft]
+
+        def hz_to_mel(hz: np.ndarray) -> np.ndarray:
+            return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+        def mel_to_hz(mel: np.ndarray) -> np.ndarray:
+            return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+        mel_points = np.linspace(
+            hz_to_mel(np.array(0.0)),
+            hz_to_mel(np.array(sampling_rate / 2)),
+            self.__n_mels + 2,
+        )
+        bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sampling_rate).astype(int)
+
+        filterbank = np.zeros((self.__n_mels, n_fft // 2 + 1), dtype=np.float32)
+        for m in range(1, self.__n_mels + 1):
+            left, center, right = bins[m - 1], bins[m], bins[m + 1]
+            for k in range(left, center):
+                filterbank[m - 1, k] = (k - left) / max(center - left, 1)
+            for k in range(center, right):
+                filterbank[m - 1, k] = (right - k) / max(right - center, 1)
+
+        self.__filterbanks[n_fft] = filterbank
+        return filterbank
+
+
+class Diarizer:
+    """
+    Assign speaker labels to a recording.
+
+    The recording is cut into overlapping windows, every voiced window
+    is embedded by an `EmbeddingBackend`, and the embeddings are
+    clustered into speakers.
+
+    Clustering is done in two passes so that the cost stays linear
+    in the recording length: an online leader clustering produces
+    a small number of fine-grained clusters, which are then merged
+    agglomeratively until they are further apart than
+    `merge_threshold` or `max_speakers` is reached.
+
+    A window is voiced when every hop it spans is louder than both
+    `silence_db` below the loud (95th percentile) hops and the absolute
+    `silence_floor_db`. The rule holds for a part of a recording as well
+    as for the whole, and for recordings mostly silent or mostly speech.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[EmbeddingBackend] = None,
+        *,
+        window_seconds: float = 1.5,
+        hop_seconds: float = 0.75,
+        max_speakers: int = 8,
+        merge_threshold: float = 0.35,
+        max_clusters: int = 64,
+        silence_db: float = 30.0,
+        silence_floor_db: float = -60.0,
+    ) -> None:
+        """
+        Initialize the diarizer.
+
+        Parameters
+        ----------
+        backend : Optional[EmbeddingBackend], optional
+            The embedding backend,
+            by default None (`SpectralEmbeddingBackend`).
+        window_seconds : float, optional
+            The length of an embedding window, by default 1.5.
+        hop_seconds : float, optional
+            The hop between embedding windows, by default 0.75.
+        max_speakers : int, optional
+            The maximum number of speakers, by default 8.
+        merge_threshold : float, optional
+            The cosine distance under which clusters are merged,
+            by default 0.35.
+        max_clusters : int, optional
+            The maximum number of clusters of the first pass,
+            by default 64.
+        silence_db : float, optional
+            Windows quieter than the loud windows by more than this
+            are treated as silence, by default 30.0.
+        silence_floor_db : float, optional
+            Windows quieter than this level in dBFS are treated as
+            silence whatever the rest of the audio is, so that a part of
+            a recording which is silent throughout has no voiced window,
+            by default -60.0.
+        """
+        self.__backend = backend or SpectralEmbeddingBackend()
+        self.__window_seconds = window_seconds
+        self.__hop_seconds = hop_seconds
+        self.__max_speakers = max_speakers
+        self.__merge_threshold = merge_threshold
+        self.__max_clusters = max_clusters
+        self.__silence_db = silence_db
+        self.__silence_floor_db = silence_floor_db
+
+    def __call__(
+        self, pcm: np.ndarray, sampling_rate: int = 16000
+    ) -> list[SpeakerTurn]:
+        """
+        Diarize a recording.
+
+        Parameters
+        ----------
+        pcm : np.ndarray
+            float32 mono PCM of the recording.
+        sampling_rate : int, optional
+            The sampling rate of the PCM, by default 16000.
+
+        Returns
+        -------
+        list[SpeakerTurn]
+            Speaker turns in chronological order.
+        """
+        return self.cluster(*self.embed(pcm, sampling_rate))
+
+    def embed(
+        self, pcm: np.ndarray, sampling_rate: int = 16000, *, offset: float = 0.0
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Embed the voiced windows of a recording, or of a part of it.
+
+        Recordings too long to be held in memory can be embedded part by
+        part, and the concatenated results passed to `cluster`.
+
+        Parameters
+        ----------
+        pcm : np.ndarray
+            float32 mono PCM of the recording.
+        sampling_rate : int, optional
+            The sampling rate of the PCM, by default 16000.
+        offset : float, optional
+            The position of the PCM in the recording in seconds,
+            by default 0.0.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Start times of the voiced windows in seconds, and
+            their embeddings of shape (n_windows, embedding_dim).
+        """
+        window_length = int(self.__window_seconds * sampling_rate)
+        hop_length = int(self.__hop_seconds * sampling_rate)
+        if len(pcm) < window_length:
+            return np.zeros(0), np.zeros((0, 0), dtype=np.float32)
+
+        windows = np.lib.stride_tricks.sliding_window_view(pcm, window_length)[
+            ::hop_length
+        ]
+        starts = offset + np.arange(len(windows)) * self.__hop_seconds
+
+        # drop windows which are silent even in part, they would form
+        # a "speaker" of their own: a window is voiced if all the hops
+        # it spans are. The threshold is relative to the loud hops, not
+        # a percentile, which would keep silence whenever a recording is
+        # mostly silent and drop speech whenever it is mostly speech
+        hops = pcm[: len(pcm) // hop_length * hop_length].reshape(-1, hop_length)
+        powers = np.einsum("ij,ij->i", hops, hops) / hop_length
+        hop_voiced = powers > max(
+            np.percentile(powers, 95) * 10 ** (-self.__silence_db / 10),
+            10 ** (self.__silence_floor_db / 10),
+        )
+        hops_per_window = max(1, window_length // hop_length)
+        voiced = np.lib.stride_tricks.sliding_window_view(
+            hop_voiced, hops_per_window
+        ).all(axis=1)[: len(windows)]
+        if not voiced.any():
+            return np.zeros(0), np.zeros((0, 0), dtype=np.float32)
+
+        # embed in batches of at most 16 windows to bound the size of
+        # the STFT intermediates (about 1 MiB per window)
+        voiced_indices = np.flatnonzero(voiced)
+        embeddings = np.concatenate(
+            [
+                self.__backend.embed(windows[batch], sampling_rate)
+                for batch in np.array_split(
+                    voiced_indices, -(-len(voiced_indices) // 16)
+                )
+            ]
+        )
+        return starts[voiced_indices], embeddings
+
+    def cluster(self, starts: np.ndarray, embeddings: np.ndarray) -> list[SpeakerTurn]:
+        """
+        Cluster embedded windows into speaker turns.
+
+        Parameters
+        ----------
+        starts : np.ndarray
+            Start times of the voiced windows in seconds, ascending.
+        embeddings : np.ndarray
+            Embeddings of the voiced windows, as returned by `embed`.
+
+        Returns
+        -------
+        list[SpeakerTurn]
+            Speaker turns in chronological order.
+        """
+        if len(starts) == 0:
+            return []
+
+        labels = self.__cluster(embeddings)
+
+        logging.info(
+            f"diarization found {len(set(labels.tolist()))} speakers "
+            f"in {len(starts)} voiced windows."
+        )
+
+        return self.__to_turns(starts, labels)
+
+    def __cluster(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Cluster embeddings into speakers.
+
+        Parameters
+        ----------
+        embeddings : np.ndarray
+            Embeddings of shape (n_windows, embedding_dim).
+
+        Returns
+        -------
+        np.ndarray
+            Speaker indices of shape (n_windows,), numbered in order of
+            first appearance.
+        """
+        # mean normalization removes the channel, then compare directions
+        embeddings = embeddings - embeddings.mean(axis=0)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10
+
+        # 1st pass: online leader clustering
+        centroids = np.zeros((self.__max_clusters, embeddings.shape[1]))
+        counts = np.zeros(self.__max_clusters)
+        n_clusters = 0
+        for embedding in embeddings:
+            if n_clusters > 0:
+                distances = 1.0 - centroids[:n_clusters] @ embedding
+                nearest = int(np.argmin(distances))
+                if (
+                    distances[nearest] < self.__merge_threshold / 2
+                    or n_clusters == self.__max_clusters
+                ):
+                    centroids[nearest] = (
+                        centroids[nearest] * counts[nearest] + embedding
+                    ) / (counts[nearest] + 1)
+                    counts[nearest] += 1
+                    continue
+            centroids[n_clusters] = embedding
+            counts[n_clusters] = 1
+            n_clusters += 1
+        centroids, counts = centroids[:n_clusters], counts[:n_clusters]
+
+        # 2nd pass: agglomerative merge of the centroids
+        while len(centroids) > 1:
+            normalized = centroids / (
+                np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-10
+            )
+            distances = 1.0 - normalized @ normalized.T
+            np.fill_diagonal(distances, np.inf)
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+            if (
+                distances[i, j] > self.__merge_threshold
+                and len(centroids) <= self.__max_speakers
+            ):
+                break
+            centroids[i] = (centroids[i] * counts[i] + centroids[j] * counts[j]) / (
+                counts[i] + counts[j]
+            )
+            counts[i] += counts[j]
+            centroids = np.delete(centroids, j, axis=0)
+            counts = np.delete(counts, j)
+
+        # final assignment to the merged centroids, which are all zero
+        # when every embedding is the mean (e.g. a single voiced window)
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-10
+        labels = np.argmax(embeddings @ centroids.T, axis=1)
+
+        # smooth isolated flips with a majority filter over 5 windows
+        if len(labels) >= 5:
+            padded = np.pad(labels, 2, mode="edge")
+            votes = np.lib.stride_tricks.sliding_window_view(padded, 5)
+            labels = np.array(
+                [np.bincount(vote).argmax() for vote in votes], dtype=labels.dtype
+            )
+
+        _, first_indices, inverse = np.unique(
+            labels, return_index=True, return_inverse=True
+        )
+        return np.argsort(np.argsort(first_indices))[inverse]
+
+    def __to_turns(self, starts: np.ndarray, labels: np.ndarray) -> list[SpeakerTurn]:
+        """
+        Merge consecutive windows of the same speaker into turns.
+
+        Parameters
+        ----------
+        starts : np.ndarray
+            Start times of the voiced windows in seconds.
+        labels : np.ndarray
+            Speaker indices of the voiced windows.
+
+        Returns
+        -------
+        list[SpeakerTurn]
+            Speaker turns in chronological order.
+        """
+        turns: list[SpeakerTurn] = []
+        turn_start, turn_end, turn_label = starts[0], starts[0], labels[0]
+        for start, label in zip(starts, labels):
+            if label != turn_label or start > turn_end + self.__hop_seconds:
+                turns.append(
+                    SpeakerTurn(
+                        start=float(turn_start),
+                        end=float(turn_end + self.__window_seconds),
+                        speaker=f"SPEAKER_{turn_label + 1}",
+                    )
+                )
+                turn_start, turn_label = start, label
+            turn_end = start
+        turns.append(
+            SpeakerTurn(
+                start=float(turn_start),
+                end=float(turn_end + self.__window_seconds),
+                speaker=f"SPEAKER_{turn_label + 1}",
+            )
+        )
+        return turns
+
+
+def assign_speaker(start: float, end: float, turns: list[SpeakerTurn]) -> Optional[str]:
+    """
+    Pick the speaker who overlaps most with the given time span.
+
+    Parameters
+    ----------
+    start : float
+        The start of the span in seconds.
+    end : float
+        The end of the span in seconds.
+    turns : list[SpeakerTurn]
+        Speaker turns in chronological order.
+
+    Returns
+    -------
+    Optional[str]
+        The speaker label, or None if there are no turns.
+    """
+    if not turns:
+        return None
+
+    overlaps: dict[str, float] = {}
+    for turn in turns:
+        if turn.start >= end:
+            break
+        overlap = min(end, turn.end) - max(start, turn.start)
+        if overlap > 0:
+            overlaps[turn.speaker] = overlaps.get(turn.speaker, 0.0) + overlap
+    if overlaps:
+        return max(overlaps, key=overlaps.__getitem__)
+
+    # no overlap (e.g. the span is in a silent gap), use the nearest turn
+    return min(
+        turns,
+        key=lambda turn: min(abs(turn.start - end), abs(turn.end - start)),
+    ).speaker
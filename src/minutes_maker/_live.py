@@ -0,0 +1,432 @@
+import logging
+import time
+from typing import Literal, Optional, Union
+
+import av
+import numpy as np
+from faster_whisper.vad import get_speech_timestamps
+
+from ._profiles import DecodingProfile
+from ._prompts import (
+    EnglishLecturePrompts,
+    EnglishMeetingPrompts,
+    JapaneseLecturePrompts,
+    JapaneseMeetingPrompts,
+)
+from ._summarizer import Summarizer
+from ._transcriber import SAMPLING_RATE, Segment, TranscribeData, Transcriber
+
+
+class PcmDecoder:
+    """
+    Decoder of raw little-endian 16-bit PCM frames.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLING_RATE) -> None:
+        """
+        Initialize the decoder.
+
+        Parameters
+        ----------
+        sample_rate : int, optional
+            The sampling rate of the frames, by default 16000.
+            Only 16000 is supported, resample on the client.
+        """
+        if sample_rate != SAMPLING_RATE:
+            raise ValueError(
+                f"pcm_s16le frames must be sampled at {SAMPLING_RATE}Hz, "
+                f"but got {sample_rate}Hz."
+            )
+
+    def __call__(self, frame: bytes) -> np.ndarray:
+        return np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class OpusDecoder:
+    """
+    Decoder of raw Opus packets, one packet per frame.
+    """
+
+    def __init__(self, sample_rate: int = 48000) -> None:
+        """
+        Initialize the decoder.
+
+        Parameters
+        ----------
+        sample_rate : int, optional
+            The sampling rate of the Opus stream, by default 48000.
+        """
+        self.__codec = av.CodecContext.create("opus", "r")
+        self.__codec.sample_rate = sample_rate
+        self.__resampler = av.AudioResampler(
+            format="s16", layout="mono", rate=SAMPLING_RATE
+        )
+
+    def __call__(self, frame: bytes) -> np.ndarray:
+        chunks: list[np.ndarray] = []
+        for decoded in self.__codec.decode(av.Packet(frame)):
+            for resampled in self.__resampler.resample(decoded):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+class LiveTranscriber:
+    """
+    Transcribe an audio stream incrementally with a rolling window.
+
+    Incoming audio is appended to a buffer which is re-transcribed every
+    `step_seconds` of new audio. Segments ending at least
+    `stability_seconds` before the end of the buffer are considered
+    stable: they are emitted and their audio is dropped from the buffer.
+    The buffer never grows beyond `window_seconds`, so neither memory
+    nor the cost of a decoding step depends on the length of the stream:
+    when the window is full, the segments overlapping the oldest audio
+    are emitted even if they are not stable yet, rather than dropped.
+
+    Besides live streams, this is also used to transcribe long files
+    chunk by chunk, with `realtime=False`.
+    """
+
+    def __init__(
+        self,
+        transcriber: Transcriber,
+        *,
+        profile: DecodingProfile,
+        prompt: str = "",
+        language: Optional[str] = None,
+        window_seconds: float = 30.0,
+        step_seconds: float = 2.0,
+        stability_seconds: float = 2.0,
+        realtime: bool = True,
+        language_speech_seconds: float = 5.0,
+    ) -> None:
+        """
+        Initialize the live transcriber.
+
+        Parameters
+        ----------
+        transcriber : Transcriber
+            The transcriber to decode the buffer with.
+        profile : DecodingProfile
+            The decoding settings.
+        prompt : str, optional
+            The initial prompt to make the model easier to understand
+            the context, by default "".
+        language : Optional[str], optional
+            The language spoken in the stream, by default None
+            (detected once `language_speech_seconds` of speech arrived).
+        window_seconds : float, optional
+            The maximum length of the buffer, by default 30.0
+            (the input length of whisper).
+        step_seconds : float, optional
+            How much new audio triggers a decoding step, by default 2.0.
+        stability_seconds : float, optional
+            How far from the end of the buffer a segment must end
+            to be emitted, by default 2.0.
+        realtime : bool, optional
+            Whether the audio arrives in real time, in which case decoding
+            steps are spaced out when they are slower than real time,
+            by default True.
+        language_speech_seconds : float, optional
+            How much speech, as found by VAD, the language is detected on
+            when it is not given, by default 5.0. Nothing is decoded
+            before, unless the window is full or the stream ends.
+        """
+        self.__transcriber = transcriber
+        self.__prompt = prompt
+        self.__profile = profile
+        self.__language = language
+        self.__window_samples = int(window_seconds * SAMPLING_RATE)
+        self.__step_samples = int(step_seconds * SAMPLING_RATE)
+        self.__stability_seconds = stability_seconds
+        self.__realtime = realtime
+        self.__language_speech_samples = int(language_speech_seconds * SAMPLING_RATE)
+
+        self.__buffer = np.zeros(0, dtype=np.float32)
+        # the position of `self.__buffer[0]` in the stream, in seconds
+        self.__buffer_offset = 0.0
+        self.__pending_samples = 0
+        self.__next_step_samples = self.__step_samples
+        self.__last_text = ""
+
+    @property
+    def received_seconds(self) -> float:
+        """
+        The length of the audio received so far, in seconds.
+        """
+        return self.__buffer_offset + len(self.__buffer) / SAMPLING_RATE
+
+    def feed(self, pcm: np.ndarray) -> list[Segment]:
+        """
+        Append audio to the buffer, and decode it if enough audio arrived.
+
+        Parameters
+        ----------
+        pcm : np.ndarray
+            16kHz mono float32 PCM.
+
+        Returns
+        -------
+        list[Segment]
+            The newly stable segments, with times relative to the start
+            of the stream.
+        """
+        self.__buffer = np.concatenate([self.__buffer, pcm])
+        self.__pending_samples += len(pcm)
+
+        if self.__pending_samples < self.__next_step_samples:
+            return []
+        return self.__step(final=False)
+
+    def flush(self) -> list[Segment]:
+        """
+        Decode and emit everything left in the buffer.
+
+        Returns
+        -------
+        list[Segment]
+            The remaining segments.
+        """
+        if len(self.__buffer) == 0:
+            return []
+        return self.__step(final=True)
+
+    def __step(self, final: bool) -> list[Segment]:
+        """
+        Decode the buffer and emit the stable segments.
+
+        Parameters
+        ----------
+        final : bool
+            Whether the stream has ended, in which case all segments
+            are emitted.
+
+        Returns
+        -------
+        list[Segment]
+            The emitted segments.
+        """
+        started = time.perf_counter()
+        # detect once, windows of music or silence must not switch it,
+        # and only on enough speech, the first words alone may mislead it
+        if self.__language is None:
+            speech_samples = sum(
+                timestamp["end"] - timestamp["start"]
+                for timestamp in get_speech_timestamps(self.__buffer)
+            )
+            if speech_samples >= self.__language_speech_samples:
+                self.__language, _ = self.__transcriber.detect_language(
+                    self.__buffer, profile=self.__profile, cache=False
+                )
+            elif (
+                not final
+                and len(self.__buffer) + self.__next_step_samples
+                <= self.__window_samples
+            ):
+                # wait for more speech, there is room left in the window
+                self.__pending_samples = 0
+                return []
+            # otherwise, whisper detects the language of this window only
+        segments = self.__transcriber.transcribe(
+            self.__buffer,
+            # whisper conditions on the preceding text,
+            # which is no longer in the buffer
+            prompt=f"{self.__prompt}{self.__last_text}",
+            profile=self.__profile,
+            language=self.__language,
+        )
+        elapsed = time.perf_counter() - started
+        self.__pending_samples = 0
+
+        # decoding slower than real time would make the latency grow
+        # without bound, so decode less often instead, but never on less
+        # than half of the window, which must hold the carried audio too
+        if self.__realtime:
+            self.__next_step_samples = min(
+                max(self.__step_samples, int(elapsed * 1.5 * SAMPLING_RATE)),
+                self.__window_samples // 2,
+            )
+        if self.__realtime and elapsed > self.__step_samples / SAMPLING_RATE:
+            logging.warning(
+                f"live decoding step took {elapsed:.2f}s, "
+                f"stepping every {self.__next_step_samples / SAMPLING_RATE:.2f}s."
+            )
+
+        buffer_seconds = len(self.__buffer) / SAMPLING_RATE
+        # the audio kept must leave room for the next step in the window
+        overflow = len(self.__buffer) - (
+            self.__window_samples - self.__next_step_samples
+        )
+        if final:
+            stable = segments
+        else:
+            n_stable = sum(
+                1
+                for segment in segments
+                if segment.end <= buffer_seconds - self.__stability_seconds
+            )
+            # the oldest audio has to go, emit the segments overlapping it
+            # even if they are not stable, their text would be lost otherwise
+            n_overflowing = sum(
+                1 for segment in segments if segment.start * SAMPLING_RATE < overflow
+            )
+            stable = segments[: max(n_stable, n_overflowing)]
+
+        emitted = [
+            Segment(
+                start=self.__buffer_offset + segment.start,
+                end=self.__buffer_offset + segment.end,
+                text=segment.text,
+            )
+            for segment in stable
+        ]
+
+        if final:
+            self.__buffer_offset += buffer_seconds
+            self.__buffer = np.zeros(0, dtype=np.float32)
+        else:
+            cut = int(stable[-1].end * SAMPLING_RATE) if stable else 0
+            if not self.__realtime:
+                # the whole step was decoded, audio before the next segment
+                # (e.g. silence) has no speech, keep `stability_seconds`
+                # of it only, not to decode it again with the next step
+                kept_from = len(self.__buffer) - int(
+                    self.__stability_seconds * SAMPLING_RATE
+                )
+                if len(segments) > len(stable):
+                    next_start = int(segments[len(stable)].start * SAMPLING_RATE)
+                    kept_from = min(kept_from, next_start)
+                cut = max(cut, kept_from)
+            # the audio overflowing the window left without any segment
+            # (e.g. silence) is dropped to keep the buffer bounded
+            cut = min(max(cut, overflow), len(self.__buffer))
+            self.__buffer_offset += cut / SAMPLING_RATE
+            self.__buffer = self.__buffer[cut:].copy()
+
+        if emitted:
+            self.__last_text = emitted[-1].text
+        for segment in emitted:
+            logging.info(segment.to_timeline())
+
+        return emitted
+
+
+class LiveSession:
+    """
+    A live transcription of a meeting or lecture, summarized when it ends.
+    """
+
+    def __init__(
+        self,
+        transcriber: Transcriber,
+        summarizer: Summarizer,
+        prompts: Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts,
+        ],
+        content: str = "",
+        *,
+        encoding: Literal["pcm_s16le", "opus"] = "pcm_s16le",
+        sample_rate: int = SAMPLING_RATE,
+        profile: str = "balanced",
+        language: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the session.
+
+        Parameters
+        ----------
+        transcriber : Transcriber
+            The transcriber to decode the stream with.
+        summarizer : Summarizer
+            The summarizer to summarize the transcript with.
+        prompts : Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts
+        ]
+            The prompts to be used.
+        content : str, optional
+            The content of the meeting or lecture, by default "".
+        encoding : Literal["pcm_s16le", "opus"], optional
+            The encoding of the incoming frames, by default "pcm_s16le".
+        sample_rate : int, optional
+            The sampling rate of the incoming frames, by default 16000.
+        profile : str, optional
+            The decoding profile, by default "balanced".
+        language : Optional[str], optional
+            The language spoken in the stream, by default None (detected).
+        """
+        if encoding == "pcm_s16le":
+            self.__decoder = PcmDecoder(sample_rate)
+        elif encoding == "opus":
+            self.__decoder = OpusDecoder(sample_rate)
+        else:
+            raise ValueError(
+                f"encoding must be either 'pcm_s16le' or 'opus', but got {encoding}."
+            )
+
+        self.__summarizer = summarizer
+        self.__prompts = prompts
+        # "auto" sees each window as a short recording
+        _, decoding_profile = transcriber.resolve_profile(profile, 30.0)
+        self.__live_transcriber = LiveTranscriber(
+            transcriber,
+            profile=decoding_profile,
+            prompt=prompts.TRANSCRIBE_FORMAT.value.format(content=content),
+            language=language,
+        )
+        self.__segments: list[Segment] = []
+
+    @property
+    def received_seconds(self) -> float:
+        """
+        The length of the audio received so far, in seconds.
+        """
+        return self.__live_transcriber.received_seconds
+
+    def feed(self, frame: bytes) -> list[Segment]:
+        """
+        Feed an encoded audio frame.
+
+        Parameters
+        ----------
+        frame : bytes
+            The encoded audio frame.
+
+        Returns
+        -------
+        list[Segment]
+            The newly stable segments.
+        """
+        segments = self.__live_transcriber.feed(self.__decoder(frame))
+        self.__segments.extend(segments)
+        return segments
+
+    def close(self) -> tuple[list[Segment], TranscribeData, str]:
+        """
+        End the stream, and summarize the transcript.
+
+        Returns
+        -------
+        tuple[list[Segment], TranscribeData, str]
+            The last segments, the whole transcript and its summary.
+        """
+        segments = self.__live_transcriber.flush()
+        self.__segments.extend(segments)
+
+        results = TranscribeData.from_segments(self.__segments)
+        if not results.transcript.strip():
+            return segments, results, ""
+
+        return (
+            segments,
+            results,
+            self.__summarizer.summarize(results.transcript, prompts=self.__prompts),
+        )
@@ -0,0 +1,159 @@
+import dataclasses
+import json
+import logging
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+PROFILE_NAMES = ("speed", "balanced", "accurate")
+
+TEMPERATURE_FALLBACK = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+@dataclass(frozen=True)
+class DecodingProfile:
+    """
+    Settings of whisper decoding, traded off between speed and accuracy.
+
+    Attributes
+    ----------
+    model_size : str
+        The size of the whisper model.
+    compute_type : str
+        The ctranslate2 compute type of the model.
+    beam_size : int
+        The beam size to use for beam search.
+    best_of : int
+        The number of candidates when sampling with non-zero temperature.
+    temperature : tuple[float, ...]
+        The temperatures to fall back to when decoding fails.
+    cpu_threads : int
+        The number of CPU threads, 0 for auto.
+    """
+
+    model_size: str
+    compute_type: str
+    beam_size: int
+    best_of: int
+    temperature: tuple[float, ...]
+    cpu_threads: int = 0
+
+
+DEFAULT_PROFILES: dict[str, dict[str, DecodingProfile]] = {
+    "cpu": {
+        "speed": DecodingProfile("base", "int8", 1, 1, (0.0,)),
+        "balanced": DecodingProfile("base", "int8", 5, 5, TEMPERATURE_FALLBACK),
+        "accurate": DecodingProfile("small", "int8", 5, 5, TEMPERATURE_FALLBACK),
+    },
+    "cuda": {
+        "speed": DecodingProfile("medium", "int8_float16", 1, 1, (0.0,)),
+        "balanced": DecodingProfile(
+            "large-v2", "int8_float16", 5, 5, TEMPERATURE_FALLBACK
+        ),
+        "accurate": DecodingProfile("large-v2", "float16", 5, 5, TEMPERATURE_FALLBACK),
+    },
+}
+
+
+@dataclass(frozen=True)
+class Calibration:
+    """
+    Result of benchmarking the decoding profiles on a host.
+
+    Attributes
+    ----------
+    device : Literal["cpu", "cuda"]
+        The device the profiles were benchmarked on.
+    real_time_factors : dict[str, float]
+        The decoding time per second of audio of each profile.
+    cpu_threads : dict[str, int]
+        The fastest number of CPU threads of each profile.
+    """
+
+    device: Literal["cpu", "cuda"]
+    real_time_factors: dict[str, float]
+    cpu_threads: dict[str, int]
+
+    @classmethod
+    def load(cls, path: str) -> "Calibration":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dataclasses.asdict(self), f, indent=4)
+
+
+def select_profile(
+    name: str,
+    audio_seconds: float,
+    *,
+    device: Literal["cpu", "cuda"],
+    calibration: Optional[Calibration] = None,
+    cpu_threads: int = 0,
+    target_rtf: float = 1.0,
+    deadline_seconds: Optional[float] = None,
+) -> tuple[str, DecodingProfile]:
+    """
+    Resolve a profile name into the decoding settings for this host.
+
+    Parameters
+    ----------
+    name : str
+        "speed", "balanced", "accurate", or "auto" to pick the most
+        accurate profile expected to meet the target real-time factor.
+    audio_seconds : float
+        The length of the audio to be transcribed.
+    device : Literal["cpu", "cuda"]
+        The device to decode on.
+    calibration : Optional[Calibration], optional
+        The calibration of this host, by default None.
+    cpu_threads : int, optional
+        The number of CPU threads forced by the user,
+        by default 0 (calibrated, or auto).
+    target_rtf : float, optional
+        The real-time factor "auto" aims at, by default 1.0.
+    deadline_seconds : Optional[float], optional
+        The time the transcription should take at most,
+        tightens `target_rtf` for "auto", by default None.
+
+    Returns
+    -------
+    tuple[str, DecodingProfile]
+        The name of the selected profile and its settings.
+    """
+    if name == "auto":
+        if deadline_seconds is not None and audio_seconds > 0:
+            target_rtf = min(target_rtf, deadline_seconds / audio_seconds)
+        name = _pick_profile(audio_seconds, target_rtf, calibration)
+        logging.info(f"selected '{name}' profile for {audio_seconds:.0f}s of audio.")
+    elif name not in PROFILE_NAMES:
+        raise ValueError(
+            f"profile must be one of {PROFILE_NAMES + ('auto',)}, but got {name}."
+        )
+
+    profile = DEFAULT_PROFILES[device][name]
+    if cpu_threads > 0:
+        profile = dataclasses.replace(profile, cpu_threads=cpu_threads)
+    elif calibration is not None and name in calibration.cpu_threads:
+        profile = dataclasses.replace(
+            profile, cpu_threads=calibration.cpu_threads[name]
+        )
+
+    return name, profile
+
+
+def _pick_profile(
+    audio_seconds: float, target_rtf: float, calibration: Optional[Calibration]
+) -> str:
+    if calibration is None:
+        # without measurements, only long recordings are worth speeding up
+        if audio_seconds < 10 * 60:
+            return "accurate"
+        if audio_seconds < 60 * 60:
+            return "balanced"
+        return "speed"
+
+    for name in reversed(PROFILE_NAMES):
+        if calibration.real_time_factors.get(name, float("inf")) <= target_rtf:
+            return name
+    return PROFILE_NAMES[0]
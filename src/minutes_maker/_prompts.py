@@ -31,6 +31,7 @@ class JapaneseMeetingPrompts(Enum):
         以下のテキストは、ある日本語の会議の内容を文字起こししたものです。
         文字起こしは機械学習モデルによって行われており、その精度は100%ではありません。
         また、文字起こしの結果には、会議の参加者の発言以外にも、雑音や会議の進行に関する記述が含まれている可能性があります。
+        各行の先頭に"SPEAKER_1: "のような話者ラベルがある場合、それは自動推定された話者を表しますが、誤っている可能性があります。
         それを踏まえた上で、以下の文字起こしを読み、ユーザーの質問に答えてください。
 
         '''
@@ -85,6 +86,7 @@ class EnglishMeetingPrompts(Enum):
         The following text is a transcription of a meeting in English.
         The transcription is done by a machine learning model, and its accuracy is not 100%.
         Also, the transcription results may include not only the participants' remarks, but also background noise and descriptions of the meeting's progress.
+        Lines prefixed with a label such as "SPEAKER_1: " are attributed to an automatically estimated speaker, which may be wrong.
         Bearing this in mind, please read the transcription below and answer the user's question.
 
         '''
@@ -139,6 +141,7 @@ class JapaneseLecturePrompts(Enum):
         以下のテキストは、ある日本語のレクチャーの内容を文字起こししたものです。
         文字起こしは機械学習モデルによって行われており、その精度は100%ではありません。
         また、文字起こしの結果には、レクチャーの参加者の発言以外にも、雑音やレクチャーの進行に関する記述が含まれている可能性があります。
+        各行の先頭に"SPEAKER_1: "のような話者ラベルがある場合、それは自動推定された話者を表しますが、誤っている可能性があります。
         それを踏まえた上で、以下の文字起こしを読み、ユーザーの質問に答えてください。
 
         '''
@@ -194,6 +197,7 @@ class EnglishLecturePrompts(Enum):
         The following text is a transcription of a lecture in English.
         The transcription is done by a machine learning model, and its accuracy is not 100%.
         Also, the transcription results may include not only the speakers' remarks, but also background noise and descriptions of the lecture's progress.
+        Lines prefixed with a label such as "SPEAKER_1: " are attributed to an automatically estimated speaker, which may be wrong.
         Bearing this in mind, please read the transcription below and answer the user's question.
 
         '''
@@ -0,0 +1,340 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+import av
+import numpy as np
+
+from ._diarizer import Diarizer, assign_speaker
+from ._live import LiveTranscriber
+from ._tracing import propagate, tracer
+from ._transcriber import SAMPLING_RATE, Segment, TranscribeData, Transcriber
+
+# the audio a chunk carries over to the next one at most, in seconds,
+# the unstable segments at its end (whisper segments are shorter than 30s)
+CARRIED_SECONDS = 30.0
+
+# the length assumed for files that do not tell it, in seconds, long enough
+# for "auto" not to pick a profile too slow for a long recording
+UNKNOWN_DURATION_SECONDS = 3 * 60 * 60.0
+
+
+class PcmReader:
+    """
+    Decode the audio stream of a file into fixed-size chunks of PCM.
+
+    Unlike `faster_whisper.decode_audio`, which returns the whole
+    recording, only one chunk is held at a time, so the memory used
+    does not depend on the length of the recording.
+    """
+
+    def __init__(self, audio_or_video_file_path: str, chunk_seconds: float) -> None:
+        """
+        Open the file.
+
+        The file may be removed once opened, it stays readable
+        until the reader is closed.
+
+        Parameters
+        ----------
+        audio_or_video_file_path : str
+            The path to the video or audio file.
+        chunk_seconds : float
+            The length of a chunk.
+        """
+        self.__container = av.open(audio_or_video_file_path)
+        self.__chunk_samples = int(chunk_seconds * SAMPLING_RATE)
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        The duration of the recording in seconds, if the file tells it.
+        """
+        if self.__container.duration is None:
+            return None
+        return self.__container.duration / av.time_base
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """
+        Decode the file chunk by chunk.
+
+        Yields
+        ------
+        np.ndarray
+            16kHz mono float32 PCM of `chunk_seconds`,
+            except for the last chunk.
+        """
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLING_RATE)
+
+        pending: list[np.ndarray] = []
+        pending_samples = 0
+        for frame in self.__container.decode(audio=0):
+            # drop the timestamps, they may be discontinuous
+            frame.pts = None
+            for resampled in resampler.resample(frame):
+                pending.append(resampled.to_ndarray().reshape(-1))
+                pending_samples += len(pending[-1])
+
+            while pending_samples >= self.__chunk_samples:
+                buffer = np.concatenate(pending)
+                yield buffer[: self.__chunk_samples].astype(np.float32) / 32768.0
+                pending = [buffer[self.__chunk_samples :]]
+                pending_samples = len(pending[0])
+
+        # flush the resampler
+        for resampled in resampler.resample(None):
+            pending.append(resampled.to_ndarray().reshape(-1))
+            pending_samples += len(pending[-1])
+
+        if pending_samples > 0:
+            yield np.concatenate(pending).astype(np.float32) / 32768.0
+
+    def close(self) -> None:
+        self.__container.close()
+
+    def __enter__(self) -> "PcmReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def chunk_seconds_for_budget(memory_budget_mb: int) -> float:
+    """
+    Choose the length of the chunks processed at once so that the audio
+    pipeline stays within a memory budget.
+
+    Whisper computes the log-mel features of the whole rolling buffer,
+    padded with 30 seconds of silence, at once. That costs about 9 times
+    its PCM: the padded copy, the 400-sample frames taken every 160
+    samples, their complex64 spectrum, the power spectrum and the mel
+    bins. Besides, the PCM of a chunk is held about 6 times: the decoded
+    chunk (twice while it is converted to float), the rolling buffer
+    (twice while it is extended) and the chunk being embedded for
+    diarization, whose batches take a few dozen MiB more.
+
+    Parameters
+    ----------
+    memory_budget_mb : int
+        The memory budget of the audio pipeline in MiB.
+
+    Returns
+    -------
+    float
+        The length of a chunk in seconds, between 30 seconds and
+        5 minutes. Budgets too small for 30 seconds are exceeded.
+    """
+    float32 = np.dtype(np.float32).itemsize
+    pcm_bytes_per_second = SAMPLING_RATE * float32
+    feature_bytes_per_second = pcm_bytes_per_second + (SAMPLING_RATE // 160) * (
+        400 * float32
+        + 201 * np.dtype(np.complex64).itemsize
+        + 2 * 200 * float32
+        + 80 * float32
+    )
+    diarization_bytes = 32 * 1024**2
+
+    # features of the carried audio and the padding, on top of the chunk
+    fixed_bytes = diarization_bytes + feature_bytes_per_second * (CARRIED_SECONDS + 30)
+    seconds = (memory_budget_mb * 1024**2 - fixed_bytes) / (
+        feature_bytes_per_second + 6 * pcm_bytes_per_second
+    )
+    return float(np.clip(seconds, 30, 5 * 60))
+
+
+class StreamingTranscriber:
+    """
+    Transcribe recordings of any length within a bounded memory.
+
+    The recording is decoded chunk by chunk, and every chunk is
+    transcribed by a rolling `LiveTranscriber`, which carries the last,
+    possibly cut, segments of a chunk over to the next one. Each chunk is
+    embedded for diarization while whisper decodes it, and only the
+    embeddings, which are tiny compared to the PCM, are kept until the
+    end for clustering.
+    """
+
+    def __init__(
+        self,
+        transcriber: Transcriber,
+        *,
+        memory_budget_mb: int = 512,
+        diarizer: Optional[Diarizer] = None,
+    ) -> None:
+        """
+        Initialize the streaming transcriber.
+
+        Parameters
+        ----------
+        transcriber : Transcriber
+            The transcriber to decode the chunks with.
+        memory_budget_mb : int, optional
+            The memory budget of the audio pipeline in MiB,
+            by default 512.
+        diarizer : Optional[Diarizer], optional
+            The diarizer to label segments with speakers,
+            by default None (no speaker labels).
+        """
+        self.__transcriber = transcriber
+        self.__diarizer = diarizer
+        self.__chunk_seconds = chunk_seconds_for_budget(memory_budget_mb)
+
+    def convert_and_transcribe(
+        self,
+        audio_or_video_file_path: str,
+        *,
+        prompt: str = "",
+        profile: str = "balanced",
+        deadline_seconds: Optional[float] = None,
+        language: Optional[str] = None,
+        remove_input: bool = False,
+        on_input_removed: Optional[Callable[[], None]] = None,
+        beam_size: Optional[int] = None,
+    ) -> TranscribeData:
+        """
+        Transcribe an audio or video file chunk by chunk.
+
+        Parameters
+        ----------
+        audio_or_video_file_path : str
+            The path to the video or audio file.
+        prompt : str, optional
+            The initial prompt to make the model easier to understand
+            the context, by default "".
+        profile : str, optional
+            The decoding profile, "speed", "balanced", "accurate" or
+            "auto" to pick one from the audio length, by default "balanced".
+        deadline_seconds : Optional[float], optional
+            The time the transcription should take at most, considered
+            by the "auto" profile, by default None.
+        language : Optional[str], optional
+            The language spoken in the audio, e.g. "ja",
+            by default None (detected once enough speech is found).
+        remove_input : bool, optional
+            Whether to remove the input file as soon as it is opened,
+            by default False.
+        on_input_removed : Optional[Callable[[], None]], optional
+            The function called once the input file is removed and its
+            space is freed, by default None.
+        beam_size : Optional[int], optional
+            The beam size overriding the one of the profile,
+            by default None.
+
+        Returns
+        -------
+        TranscribeData
+            The transcribed text and the timeline of the audio file.
+        """
+        segments: list[Segment] = []
+        starts: list[np.ndarray] = []
+        embeddings: list[np.ndarray] = []
+
+        with tracer.start_as_current_span(
+            "convert_and_transcribe",
+            {
+                "file.bytes": os.path.getsize(audio_or_video_file_path),
+                "streaming": True,
+                "chunk_seconds": self.__chunk_seconds,
+            },
+        ) as span, PcmReader(audio_or_video_file_path, self.__chunk_seconds) as reader:
+            if remove_input:
+                os.remove(audio_or_video_file_path)
+
+            profile_name, decoding_profile = self.__transcriber.resolve_profile(
+                profile,
+                (
+                    reader.duration
+                    if reader.duration is not None
+                    else UNKNOWN_DURATION_SECONDS
+                ),
+                deadline_seconds=deadline_seconds,
+                beam_size=beam_size,
+            )
+            span.set_attributes(
+                {
+                    "whisper.profile": profile_name,
+                    "whisper.model": decoding_profile.model_size,
+                    "whisper.compute_type": decoding_profile.compute_type,
+                }
+            )
+            rolling: Optional[LiveTranscriber] = None
+            offset = 0.0
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                for chunk in reader:
+                    embed_future = (
+                        executor.submit(propagate(self.__embed), chunk, offset)
+                        if self.__diarizer is not None
+                        else None
+                    )
+
+                    if rolling is None:
+                        rolling = LiveTranscriber(
+                            self.__transcriber,
+                            profile=decoding_profile,
+                            prompt=prompt,
+                            # when not given, the language is detected once
+                            # enough speech is found, not on the first chunk
+                            language=language,
+                            # room for the segments carried over
+                            window_seconds=self.__chunk_seconds + CARRIED_SECONDS,
+                            step_seconds=self.__chunk_seconds,
+                            stability_seconds=5.0,
+                            realtime=False,
+                        )
+
+                    segments.extend(rolling.feed(chunk))
+                    offset += len(chunk) / SAMPLING_RATE
+
+                    if embed_future is not None:
+                        chunk_starts, chunk_embeddings = embed_future.result()
+                        if len(chunk_starts) > 0:
+                            starts.append(chunk_starts)
+                            embeddings.append(chunk_embeddings)
+
+                    logging.info(f"transcribed {offset:.0f}s of audio.")
+
+            # the removed file keeps its space until it is closed
+            reader.close()
+            if remove_input and on_input_removed is not None:
+                on_input_removed()
+
+            if rolling is not None:
+                segments.extend(rolling.flush())
+            span.set_attribute("audio.seconds", offset)
+
+            if self.__diarizer is None or not starts:
+                return TranscribeData.from_segments(segments)
+
+            with tracer.start_as_current_span("diarize.cluster") as cluster_span:
+                turns = self.__diarizer.cluster(
+                    np.concatenate(starts), np.concatenate(embeddings)
+                )
+                cluster_span.set_attribute(
+                    "diarize.speakers", len({turn.speaker for turn in turns})
+                )
+
+            return TranscribeData.from_segments(
+                [
+                    Segment(
+                        start=segment.start,
+                        end=segment.end,
+                        text=segment.text,
+                        speaker=assign_speaker(segment.start, segment.end, turns),
+                    )
+                    for segment in segments
+                ]
+            )
+
+    def __embed(
+        self, chunk: np.ndarray, offset: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        with tracer.start_as_current_span(
+            "diarize.embed",
+            {
+                "audio.offset_seconds": offset,
+                "audio.seconds": len(chunk) / SAMPLING_RATE,
+            },
+        ):
+            return self.__diarizer.embed(chunk, SAMPLING_RATE, offset=offset)
@@ -1,70 +1,196 @@
 import logging
-import os
-from typing import Union
+from typing import Optional, Union
 
-import openai
 import tiktoken
 
+from ._backends import LLMBackend, Messages, OpenAIBackend
+from ._cache import JsonCache, hash_key
 from ._prompts import (
     EnglishLecturePrompts,
     EnglishMeetingPrompts,
     JapaneseLecturePrompts,
     JapaneseMeetingPrompts,
 )
+from ._tracing import tracer
 
 
 class Summarizer:
     """
-    A class to summarize research papers using OpenAI's API.
+    A class to summarize transcripts using a chat completion backend.
 
     Attributes
     ----------
     model : str
-        The OpenAI model to be used for summarization.
-    language : Literal["ja", "en"]
+        The model to be used for summarization.
     """
 
-    def __init__(self, model: str = "gpt-3.5-turbo-16k-0613") -> None:
+    def __init__(
+        self,
+        model: str = "gpt-3.5-turbo-16k-0613",
+        *,
+        backend: Optional[LLMBackend] = None,
+        max_context_length: Optional[int] = None,
+        max_generation_length: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+    ) -> None:
         """
-        Initialize the Summarizer class with an OCRModel instance and
-        set the OpenAI API key.
+        Initialize the Summarizer class with a chat completion backend.
 
         Parameters
         ----------
         model : str, optional
             The OpenAI model to be used for summarization,
             by default "gpt-3.5-turbo-16k-0613".
+            Ignored if `backend` is given.
+        backend : Optional[LLMBackend], optional
+            The backend generating the completions,
+            by default None (`OpenAIBackend` of `model`).
+        max_context_length : Optional[int], optional
+            The number of transcript tokens sent at once, by default None
+            (guessed from the model name).
+        max_generation_length : Optional[int], optional
+            The maximum number of tokens generated by a call, by default
+            None (half of `max_context_length`, at most 3000). The prompt
+            and the generated tokens must fit in the context of the model.
+        cache_dir : Optional[str], optional
+            The directory to persist condensed transcripts to,
+            by default None (kept in memory only).
         """
-        self.__model = model
-        self.__tokenizer = tiktoken.encoding_for_model(self.__model)
+        self.__backend = backend or OpenAIBackend(model=model)
+        self.__model = self.__backend.model
+        self.__condensed_cache = JsonCache(cache_dir)
 
-        openai.organization = os.getenv("OPENAI_ORGANIZATION", "")
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        try:
+            self.__tokenizer = tiktoken.encoding_for_model(self.__model)
+        except KeyError:
+            # local models are not known to tiktoken, the token counts
+            # are only used for chunking, so an approximation is enough
+            self.__tokenizer = tiktoken.get_encoding("cl100k_base")
 
-        if "16k" in self.__model:
+        if max_context_length is not None:
+            self.__max_context_length = max_context_length
+        elif "16k" in self.__model:
             self.__max_context_length = 12500
-            self.__max_generation_length = 3000
         elif "32k" in self.__model:
             self.__max_context_length = 28500
-            self.__max_generation_length = 3000
         else:
             self.__max_context_length = 4500
-            self.__max_generation_length = 3000
             logging.warning(
-                "Warning: The model you are using is not suitable for summarization.",
-                "You should use 'gpt-3.5-turbo-16k-0613' or 'gpt-4-32k'.",
+                "Warning: The model you are using is not suitable for summarization. "
+                "You should use 'gpt-3.5-turbo-16k-0613' or 'gpt-4-32k'."
+            )
+
+        # a shortened part must be shorter than the part it replaces,
+        # or shortening would never end
+        self.__max_generation_length = max_generation_length or min(
+            3000, self.__max_context_length // 2
+        )
+        if self.__max_generation_length >= self.__max_context_length:
+            raise ValueError(
+                f"max_generation_length ({self.__max_generation_length}) must be "
+                f"smaller than max_context_length ({self.__max_context_length})."
             )
 
-        # Somehow cannot extend the Enum class,
-        # we cannot make base class for prompts.
-        self.__prompts: Union[
+    def summarize(
+        self,
+        transcript: str,
+        prompts: Union[
             JapaneseLecturePrompts,
             JapaneseMeetingPrompts,
             EnglishLecturePrompts,
             EnglishMeetingPrompts,
-        ] = None
+        ],
+    ) -> str:
+        """
+        Summarize the given text using the language model.
 
-    def summarize(
+        The condensed form of a transcript that is too long for the model
+        is cached, so summarizing the same transcript again with other
+        prompts (e.g. another language or category) costs a single call.
+
+        Parameters
+        ----------
+        transcript : str
+            The transcript of the meeting.
+            Texts are split into sentences by newline characters.
+        prompts : Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts
+        ]
+            The prompts to be used for summarization.
+
+        Returns
+        -------
+        str
+            The summarized text.
+        """
+        with tracer.start_as_current_span(
+            "summarize",
+            {"llm.model": self.__model, "transcript.chars": len(transcript)},
+        ):
+            return self.__complete(
+                [
+                    {
+                        "role": "system",
+                        "content": prompts.SUMMARIZE_SYSTEM_PROMPT.value.format(
+                            transcript=self.__condense_transcript(transcript, prompts)
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": prompts.SUMMARIZE_USER_PROMPT_FOR_SUMMARY.value,
+                    },
+                ],
+                stage="summary",
+            )
+
+    def __complete(
+        self,
+        messages: Messages,
+        *,
+        stage: str,
+        attributes: Optional[dict[str, Union[str, int]]] = None,
+    ) -> str:
+        """
+        Call the backend in a span recording the token counts.
+
+        Parameters
+        ----------
+        messages : Messages
+            The chat messages.
+        stage : str
+            "shortening" or "summary".
+        attributes : Optional[dict[str, Union[str, int]]], optional
+            More attributes of the span, by default None.
+
+        Returns
+        -------
+        str
+            The content of the generated message.
+        """
+        with tracer.start_as_current_span(
+            f"llm.{stage}",
+            {
+                "llm.model": self.__model,
+                "llm.max_tokens": self.__max_generation_length,
+                "llm.prompt_tokens": sum(
+                    len(self.__tokenizer.encode(message["content"]))
+                    for message in messages
+                ),
+                **(attributes or {}),
+            },
+        ) as span:
+            content = self.__backend.complete(
+                messages=messages, max_tokens=self.__max_generation_length
+            )
+            span.set_attribute(
+                "llm.completion_tokens", len(self.__tokenizer.encode(content))
+            )
+            return content
+
+    def __condense_transcript(
         self,
         transcript: str,
         prompts: Union[
@@ -75,7 +201,7 @@ class Summarizer:
         ],
     ) -> str:
         """
-        Summarize the given text using OpenAI's language model.
+        Get the shortened transcript from the cache, or shorten it.
 
         Parameters
         ----------
@@ -88,41 +214,56 @@ class Summarizer:
             EnglishLecturePrompts,
             EnglishMeetingPrompts
         ]
-            The prompts to be used for summarization.
+            The prompts to be used for shortening.
 
         Returns
         -------
         str
-            The summarized text.
+            The shortened text.
         """
-        self.__prompts = prompts
-        response = openai.ChatCompletion.create(
-            model=self.__model,
-            max_tokens=self.__max_generation_length,
-            messages=[
-                {
-                    "role": "system",
-                    "content": self.__prompts.SUMMARIZE_SYSTEM_PROMPT.value.format(
-                        transcript=self.__shortening_transcript(transcript)
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": self.__prompts.SUMMARIZE_USER_PROMPT_FOR_SUMMARY.value,
-                },
-            ],
-        )
-        return response["choices"][0]["message"]["content"]
+        # the condensed form depends on the model's context length,
+        # but not on the prompts used for the final summary
+        key = hash_key(self.__model, str(self.__max_context_length), transcript)
+
+        condensed = self.__condensed_cache.get(key)
+        span = tracer.current_span()
+        if span is not None:
+            span.set_attribute("cache.hit", condensed is not None)
+        if condensed is not None:
+            logging.info("reusing the condensed transcript from the cache.")
+            return condensed
+
+        condensed = self.__shortening_transcript(transcript, prompts)
+        if condensed != transcript:
+            self.__condensed_cache.set(key, condensed)
+
+        return condensed
 
-    def __shortening_transcript(self, transcript: str) -> str:
+    def __shortening_transcript(
+        self,
+        transcript: str,
+        prompts: Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts,
+        ],
+    ) -> str:
         """
-        Shorten the given transcript using OpenAI's language model.
+        Shorten the given transcript using the language model.
 
         Parameters
         ----------
         transcript : str
             The transcript of the meeting.
             Texts are split into sentences by newline characters.
+        prompts : Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts
+        ]
+            The prompts to be used for shortening.
 
         Returns
         -------
@@ -130,53 +271,77 @@ class Summarizer:
             The shortened text.
         """
         tokenized = self.__tokenizer.encode(transcript)
-        while len(tokenized) > self.__max_context_length:
+        span = tracer.current_span()
+        if span is not None:
+            span.set_attribute("transcript.tokens", len(tokenized))
+
+        # the shortened part, followed by `tokenized[position:]`, is the
+        # transcript left to shorten, only the former is rebuilt each round
+        carried: list[int] = []
+        position = 0
+        shortening_round = 0
+        while len(carried) + len(tokenized) - position > self.__max_context_length:
             logging.info(
-                f"transcript is too long ({len(tokenized)} tokens)",
-                "shortening transcript...",
+                "transcript is too long "
+                f"({len(carried) + len(tokenized) - position} tokens), "
+                "shortening transcript..."
             )
-            # seperate `tokenized` by newline token with the close index
+            window_end = position + self.__max_context_length + 200 - len(carried)
+            window = carried + tokenized[position:window_end]
+            # seperate `window` by newline token with the close index
             # to `self.__max_context_length`
             close_token_idx = None
+            search_start = self.__max_context_length - 100
             for i, token in enumerate(
-                tokenized[
-                    self.__max_context_length - 100 : self.__max_context_length + 200
-                ]
+                window[search_start : self.__max_context_length + 200]
             ):
                 if token in [198, 345, 627, 4999, 5380, 9174, 95532]:
-                    close_token_idx = self.__max_context_length - 100 + i
+                    close_token_idx = search_start + i
                     break
 
             # if no newline token is close to `self.__max_context_length` th,
-            # just split `tokenized` at `self.__max_context_length`
+            # just split `window` at `self.__max_context_length`
             if close_token_idx is None:
                 close_token_idx = self.__max_context_length
 
             # shorten the part of transcript
-            shortened = openai.ChatCompletion.create(
-                model=self.__model,
-                max_tokens=self.__max_generation_length,
-                messages=[
+            shortening_round += 1
+            shortened = self.__complete(
+                [
                     {
                         "role": "system",
-                        "content": self.__prompts.SUMMARIZE_SYSTEM_PROMPT.value.format(
-                            transcript=self.__tokenizer.decode(
-                                tokenized[:close_token_idx]
-                            )
+                        "content": prompts.SUMMARIZE_SYSTEM_PROMPT.value.format(
+                            transcript=self.__tokenizer.decode(window[:close_token_idx])
                         ),
                     },
                     {
                         "role": "user",
-                        "content": self.__prompts.SUMMARIZE_USER_PROMPT_FOR_SHORTENING.value,
+                        "content": prompts.SUMMARIZE_USER_PROMPT_FOR_SHORTENING.value,
                     },
                 ],
-            )["choices"][0]["message"]["content"]
-
-            # concatenate the shortened part and the rest of transcript
-            tokenized = (
-                self.__tokenizer.encode(f"{shortened}\n") + tokenized[close_token_idx:]
+                stage="shortening",
+                attributes={
+                    "llm.round": shortening_round,
+                    "transcript.remaining_tokens": len(carried)
+                    + len(tokenized)
+                    - position,
+                },
             )
 
-            logging.info(f"shortened transcript to {len(tokenized)} tokens.")
+            # the shortened part replaces the part of transcript it covers
+            remaining = len(carried) + len(tokenized) - position
+            position += close_token_idx - len(carried)
+            carried = self.__tokenizer.encode(f"{shortened}\n")
+            if len(carried) + len(tokenized) - position >= remaining:
+                raise RuntimeError(
+                    f"The LLM did not shorten the transcript ({len(carried)} "
+                    f"tokens generated from {close_token_idx}), lower "
+                    "max_generation_length."
+                )
+
+            logging.info(
+                "shortened transcript to "
+                f"{len(carried) + len(tokenized) - position} tokens."
+            )
 
-        return self.__tokenizer.decode(tokenized)
+        return self.__tokenizer.decode(carried + tokenized[position:])
@@ -0,0 +1,583 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar, Union
+
+AttributeValue = Union[str, bool, int, float]
+
+T = TypeVar("T")
+
+
+class Span:
+    """
+    A timed operation of a job, following the OpenTelemetry data model,
+    so that the exported spans can be read by the usual trace viewers.
+
+    Attributes
+    ----------
+    name : str
+        The name of the operation.
+    trace_id : str
+        The hex id shared by all spans of a job.
+    span_id : str
+        The hex id of the span.
+    parent_id : Optional[str]
+        The id of the enclosing span, None for the root span.
+    attributes : dict[str, AttributeValue]
+        The attributes of the operation, e.g. the length of the audio.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        attributes: Optional[dict[str, AttributeValue]] = None,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: dict[str, AttributeValue] = dict(attributes or {})
+        self.events: list[tuple[int, str, dict[str, AttributeValue]]] = []
+        self.error: Optional[str] = None
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        # spans may be updated from the worker threads of a job
+        self.__lock = threading.Lock()
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        with self.__lock:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict[str, AttributeValue]) -> None:
+        with self.__lock:
+            self.attributes.update(attributes)
+
+    def add_event(
+        self, name: str, attributes: Optional[dict[str, AttributeValue]] = None
+    ) -> None:
+        with self.__lock:
+            self.events.append((time.time_ns(), name, dict(attributes or {})))
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.error = f"{type(exception).__name__}: {exception}"
+        self.add_event(
+            "exception",
+            {
+                "exception.type": type(exception).__name__,
+                "exception.message": str(exception),
+            },
+        )
+
+    def end(self) -> None:
+        self.end_time_ns = time.time_ns()
+
+    def to_dict(self) -> dict[str, Any]:
+        with self.__lock:
+            return {
+                "name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "start_time_ns": self.start_time_ns,
+                "end_time_ns": self.end_time_ns,
+                "attributes": dict(self.attributes),
+                "events": [
+                    {"time_ns": time_ns, "name": name, "attributes": attributes}
+                    for time_ns, name, attributes in self.events
+                ],
+                "error": self.error,
+            }
+
+
+class SpanExporter(ABC):
+    """
+    Base class of the destinations of finished spans.
+    """
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        """
+        Export a finished span.
+
+        This is called on the thread of the job, so it must not block.
+
+        Parameters
+        ----------
+        span : Span
+            The finished span.
+        """
+
+    def shutdown(self) -> None:
+        """
+        Flush the spans not exported yet.
+        """
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Exporter appending spans to a local file, one JSON object per line.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file, created if needed.
+        """
+        self.__file = open(path, "a", encoding="utf-8", buffering=1)
+        self.__lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self.__lock:
+            self.__file.write(f"{line}\n")
+
+    def shutdown(self) -> None:
+        with self.__lock:
+            self.__file.close()
+
+
+class OTLPSpanExporter(SpanExporter):
+    """
+    Exporter sending spans to an OpenTelemetry collector (or Jaeger,
+    Tempo, etc.) over OTLP/HTTP with JSON encoding.
+
+    Spans are queued and sent in batches by a background thread,
+    so a slow or unreachable collector never delays a job. Spans that
+    cannot be sent are dropped with a warning.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://localhost:4318/v1/traces",
+        *,
+        service_name: str = "minutes-maker",
+        max_batch_size: int = 512,
+        export_interval: float = 5.0,
+    ) -> None:
+        """
+        Initialize the exporter and start the sending thread.
+
+        Parameters
+        ----------
+        endpoint : str, optional
+            The OTLP/HTTP traces endpoint of the collector,
+            by default "http://localhost:4318/v1/traces".
+            "/v1/traces" is appended to a bare base URL.
+        service_name : str, optional
+            The name of the service the spans are attributed to,
+            by default "minutes-maker".
+        max_batch_size : int, optional
+            The maximum number of spans sent at once, by default 512.
+        export_interval : float, optional
+            How long spans wait for a batch to fill up,
+            by default 5.0 seconds.
+        """
+        if not endpoint.rstrip("/").endswith("/v1/traces"):
+            endpoint = f"{endpoint.rstrip('/')}/v1/traces"
+        self.__endpoint = endpoint
+        self.__service_name = service_name
+        self.__max_batch_size = max_batch_size
+        self.__export_interval = export_interval
+        self.__spans: queue.Queue[Optional[Span]] = queue.Queue()
+
+        self.__thread = threading.Thread(target=self.__send_forever, daemon=True)
+        self.__thread.start()
+
+    def export(self, span: Span) -> None:
+        self.__spans.put(span)
+
+    def shutdown(self) -> None:
+        self.__spans.put(None)
+        self.__thread.join(timeout=self.__export_interval + 10.0)
+
+    def __send_forever(self) -> None:
+        """
+        Collect queued spans into batches and send them, until shutdown.
+        """
+        running = True
+        while running:
+            batch: list[Span] = []
+            deadline = time.monotonic() + self.__export_interval
+            while len(batch) < self.__max_batch_size:
+                try:
+                    span = self.__spans.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if span is None:
+                    running = False
+                    break
+                batch.append(span)
+
+            if batch:
+                self.__send(batch)
+
+    def __send(self, batch: list[Span]) -> None:
+        request = urllib.request.Request(
+            self.__endpoint,
+            data=json.dumps(self.__encode(batch)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10.0) as response:
+                response.read()
+        except Exception as e:
+            logging.warning(f"dropped {len(batch)} spans, could not export: {e}")
+
+    def __encode(self, batch: list[Span]) -> dict[str, Any]:
+        spans = []
+        for span in batch:
+            span_dict = span.to_dict()
+            spans.append(
+                {
+                    "traceId": span_dict["trace_id"],
+                    "spanId": span_dict["span_id"],
+                    "parentSpanId": span_dict["parent_id"] or "",
+                    "name": span_dict["name"],
+                    # SPAN_KIND_INTERNAL
+                    "kind": 1,
+                    "startTimeUnixNano": str(span_dict["start_time_ns"]),
+                    "endTimeUnixNano": str(span_dict["end_time_ns"]),
+                    "attributes": _encode_attributes(span_dict["attributes"]),
+                    "events": [
+                        {
+                            "timeUnixNano": str(event["time_ns"]),
+                            "name": event["name"],
+                            "attributes": _encode_attributes(event["attributes"]),
+                        }
+                        for event in span_dict["events"]
+                    ],
+                    # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+                    "status": {"code": 2, "message": span_dict["error"]}
+                    if span_dict["error"] is not None
+                    else {"code": 0},
+                }
+            )
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _encode_attributes(
+                            {"service.name": self.__service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "minutes_maker"}, "spans": spans}
+                    ],
+                }
+            ]
+        }
+
+
+def _encode_attributes(attributes: dict[str, AttributeValue]) -> list[dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            any_value: dict[str, Any] = {"boolValue": value}
+        elif isinstance(value, int):
+            any_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            any_value = {"doubleValue": value}
+        else:
+            any_value = {"stringValue": str(value)}
+        encoded.append({"key": key, "value": any_value})
+    return encoded
+
+
+class Tracer:
+    """
+    Create the spans of jobs and hand the finished ones to an exporter.
+
+    The current span is kept in a context variable, so spans opened
+    inside another span become its children, including across threads
+    when the work is submitted through `propagate`. Without an exporter,
+    spans are still created (so that attributes can be set anywhere)
+    but dropped when they end.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None) -> None:
+        self.__exporter = exporter
+        self.__current_span: contextvars.ContextVar[
+            Optional[Span]
+        ] = contextvars.ContextVar("current_span", default=None)
+        # the innermost span of each thread, read by `SamplingProfiler`
+        self.__thread_spans: dict[int, Span] = {}
+        self.__thread_spans_lock = threading.Lock()
+
+    def configure(self, exporter: Optional[SpanExporter]) -> None:
+        """
+        Replace the exporter, shutting down the previous one.
+
+        Parameters
+        ----------
+        exporter : Optional[SpanExporter]
+            The exporter of finished spans, None to drop them.
+        """
+        previous, self.__exporter = self.__exporter, exporter
+        if previous is not None:
+            previous.shutdown()
+        if exporter is not None:
+            atexit.register(exporter.shutdown)
+
+    def current_span(self) -> Optional[Span]:
+        """
+        The innermost open span of the current context, if any.
+        """
+        return self.__current_span.get()
+
+    @contextmanager
+    def start_as_current_span(
+        self, name: str, attributes: Optional[dict[str, AttributeValue]] = None
+    ) -> Iterator[Span]:
+        """
+        Open a span for the duration of the context.
+
+        An exception escaping the context is recorded on the span.
+
+        Parameters
+        ----------
+        name : str
+            The name of the operation.
+        attributes : Optional[dict[str, AttributeValue]], optional
+            The attributes known when the operation starts,
+            by default None.
+
+        Yields
+        ------
+        Span
+            The span, to set more attributes on.
+        """
+        parent = self.__current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes,
+        )
+        try:
+            with self.use_span(span):
+                yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            span.end()
+            if self.__exporter is not None:
+                self.__exporter.export(span)
+
+    @contextmanager
+    def use_span(self, span: Optional[Span]) -> Iterator[Optional[Span]]:
+        """
+        Make a span the current one for the duration of the context,
+        without ending it, e.g. to work for the caller of a request
+        queued to another thread.
+
+        Parameters
+        ----------
+        span : Optional[Span]
+            The span, None for no current span.
+
+        Yields
+        ------
+        Optional[Span]
+            The span.
+        """
+        token = self.__current_span.set(span)
+
+        # the event loop thread interleaves the coroutines of all jobs,
+        # only threads working for a single job are attributed to it
+        thread_id = None if span is None or _in_event_loop() else threading.get_ident()
+        previous = None
+        if thread_id is not None:
+            with self.__thread_spans_lock:
+                previous = self.__thread_spans.get(thread_id)
+                self.__thread_spans[thread_id] = span
+
+        try:
+            yield span
+        finally:
+            if thread_id is not None:
+                with self.__thread_spans_lock:
+                    if previous is None:
+                        del self.__thread_spans[thread_id]
+                    else:
+                        self.__thread_spans[thread_id] = previous
+            self.__current_span.reset(token)
+
+    def record_span(
+        self,
+        name: str,
+        start_time_ns: int,
+        end_time_ns: int,
+        attributes: Optional[dict[str, AttributeValue]] = None,
+    ) -> Span:
+        """
+        Record a child of the current span for an operation that was
+        timed by other means, e.g. an upload observed through callbacks.
+
+        Parameters
+        ----------
+        name : str
+            The name of the operation.
+        start_time_ns : int
+            The start time of the operation, as `time.time_ns`.
+        end_time_ns : int
+            The end time of the operation, as `time.time_ns`.
+        attributes : Optional[dict[str, AttributeValue]], optional
+            The attributes of the operation, by default None.
+
+        Returns
+        -------
+        Span
+            The finished span.
+        """
+        parent = self.__current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes,
+        )
+        span.start_time_ns = start_time_ns
+        span.end_time_ns = end_time_ns
+        if self.__exporter is not None:
+            self.__exporter.export(span)
+        return span
+
+    def thread_spans(self) -> dict[int, Span]:
+        """
+        The innermost open span of each thread working for a job.
+        """
+        with self.__thread_spans_lock:
+            return dict(self.__thread_spans)
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def propagate(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Bind a function to the current span, so that the spans it opens on
+    another thread (e.g. submitted to an executor) belong to the same job.
+
+    Parameters
+    ----------
+    function : Callable[..., T]
+        The function to be run on another thread.
+
+    Returns
+    -------
+    Callable[..., T]
+        The function running in a copy of the current context.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs) -> T:
+        # a context cannot be entered by two threads at once
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler of the threads working for a single job.
+
+    While active, a background thread periodically samples the Python
+    stacks of the threads whose current span belongs to the trace, so
+    concurrent jobs do not pollute the profile. The samples are written
+    in the collapsed stack format read by flamegraph.pl and speedscope,
+    rooted at the name of the span each sample was taken in.
+    """
+
+    def __init__(
+        self,
+        tracer: Tracer,
+        trace_id: str,
+        path: str,
+        *,
+        interval: float = 0.01,
+    ) -> None:
+        """
+        Initialize the profiler.
+
+        Parameters
+        ----------
+        tracer : Tracer
+            The tracer opening the spans of the job.
+        trace_id : str
+            The trace id of the job to profile.
+        path : str
+            The path to write the collapsed stacks to.
+        interval : float, optional
+            The sampling interval, by default 0.01 seconds.
+        """
+        self.path = path
+        self.__tracer = tracer
+        self.__trace_id = trace_id
+        self.__interval = interval
+        self.__samples: Counter[str] = Counter()
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample_forever, daemon=True)
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.__stopped.set()
+        self.__thread.join()
+
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, count in self.__samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.info(f"wrote {sum(self.__samples.values())} samples to {self.path}.")
+
+    def __sample_forever(self) -> None:
+        while not self.__stopped.wait(self.__interval):
+            frames = sys._current_frames()
+            for thread_id, span in self.__tracer.thread_spans().items():
+                frame = frames.get(thread_id)
+                if span.trace_id != self.__trace_id or frame is None:
+                    continue
+
+                stack: list[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} "
+                        f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(span.name)
+                self.__samples[";".join(reversed(stack))] += 1
+
+
+tracer = Tracer()
@@ -1,9 +1,67 @@
+import dataclasses
+import hashlib
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Literal
+from typing import Callable, Literal, Optional
 
-from faster_whisper import WhisperModel
-from pydub import AudioSegment
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.vad import get_speech_timestamps
+
+from ._cache import JsonCache
+from ._diarizer import Diarizer, SpeakerTurn, assign_speaker
+from ._profiles import (
+    DEFAULT_PROFILES,
+    PROFILE_NAMES,
+    Calibration,
+    DecodingProfile,
+    select_profile,
+)
+from ._tracing import propagate, tracer
+
+SAMPLING_RATE = 16000
+
+# language is detected on up to 30s of speech (the input length of whisper)
+# found in the first 10 minutes of the audio
+LANGUAGE_DETECTION_SECONDS = 30
+LANGUAGE_SCAN_SECONDS = 10 * 60
+
+# the languages whisper can transcribe, in the order of its tokenizer
+LANGUAGE_CODES = tuple(
+    (
+        "en zh de es ru ko fr ja pt tr pl ca nl ar sv it id hi fi vi he uk el ms cs "
+        "ro da hu ta no th ur hr bg lt la mi ml cy sk te fa lv bn sr az sl kn et mk "
+        "br eu is hy ne mn bs kk sq sw gl mr pa si km sn yo so af oc ka be tg sd gu "
+        "am yi lo uz fo ht ps tk nn mt sa lb my bo tl mg as tt haw ln ha ba jw su"
+    ).split()
+)
+
+
+@dataclass(frozen=True)
+class Segment:
+    start: float
+    end: float
+    text: str
+    speaker: Optional[str] = None
+
+    def to_timeline(self) -> str:
+        timeline = (
+            f"[{int(self.start // 60)}m{int(self.start % 60)}s -> "
+            f"{int(self.end // 60)}m{int(self.end % 60)}s]"
+        )
+        if self.speaker is not None:
+            timeline += f" ({self.speaker})"
+        return f"{timeline} **{self.text.strip()}**"
+
+    def to_transcript(self) -> str:
+        if self.speaker is not None:
+            return f"{self.speaker}: {self.text.strip()}"
+        return self.text
 
 
 @dataclass(frozen=True)
@@ -11,6 +69,13 @@ class TranscribeData:
     timeline: str
     transcript: str
 
+    @classmethod
+    def from_segments(cls, segments: list[Segment]) -> "TranscribeData":
+        return cls(
+            timeline="\n\n".join(segment.to_timeline() for segment in segments),
+            transcript="\n".join(segment.to_transcript() for segment in segments),
+        )
+
 
 class Transcriber:
     def __init__(
@@ -19,6 +84,11 @@ class Transcriber:
         *,
         cpu_threads: int = 0,
         num_workers: int = 1,
+        diarizer: Optional[Diarizer] = None,
+        calibration: Optional[Calibration] = None,
+        target_rtf: float = 1.0,
+        cache_dir: Optional[str] = None,
+        max_models: int = 2,
     ) -> None:
         """
         Initialize the transcriber.
@@ -29,19 +99,149 @@ class Transcriber:
             The device to use for inference, by default 'cuda'.
         cpu_threads : int, optional
             The number of CPU threads to use for inference,
-            by default 0 (auto).
+            by default 0 (calibrated, or auto).
         num_workers : int, optional
             The number of workers to use for inference,
             by default 1 (non-parallel).
+        diarizer : Optional[Diarizer], optional
+            The diarizer to label segments with speakers,
+            by default None (no speaker labels).
+        calibration : Optional[Calibration], optional
+            The result of `calibrate` on this host,
+            by default None (built-in profiles only).
+        target_rtf : float, optional
+            The real-time factor the "auto" profile aims at,
+            by default 1.0.
+        cache_dir : Optional[str], optional
+            The directory to persist detected languages to,
+            by default None (kept in memory only).
+        max_models : int, optional
+            The number of models kept loaded, by default 2. The least
+            recently used one is unloaded when another one is loaded
+            (once the jobs using it are done).
+        """
+        self.__device = device
+        self.__cpu_threads = cpu_threads
+        self.__num_workers = num_workers
+        self.__diarizer = diarizer
+        self.__target_rtf = target_rtf
+        self.__language_cache = JsonCache(
+            os.path.join(cache_dir, "languages") if cache_dir is not None else None
+        )
+
+        if calibration is not None and calibration.device != device:
+            logging.warning(
+                f"ignoring the calibration for '{calibration.device}', "
+                f"running on '{device}'."
+            )
+            calibration = None
+        self.__calibration = calibration
+
+        # models are loaded on first use of a profile,
+        # except the default one, not to slow down the first request
+        self.__models: OrderedDict[tuple[str, str, int], WhisperModel] = OrderedDict()
+        self.__max_models = max_models
+        # the models being loaded, jobs needing one wait for its future,
+        # the others do not wait for the load (which may download it)
+        self.__loading: dict[tuple[str, str, int], Future] = {}
+        self.__models_lock = threading.Lock()
+        self.__load_model(self.resolve_profile("balanced")[1])
+
+    def resolve_profile(
+        self,
+        profile: str,
+        audio_seconds: float = 0.0,
+        *,
+        deadline_seconds: Optional[float] = None,
+        beam_size: Optional[int] = None,
+    ) -> tuple[str, DecodingProfile]:
+        """
+        Resolve a profile name into the decoding settings for this host.
+
+        Parameters
+        ----------
+        profile : str
+            "speed", "balanced", "accurate" or "auto".
+        audio_seconds : float, optional
+            The length of the audio to be transcribed, by default 0.0.
+        deadline_seconds : Optional[float], optional
+            The time the transcription should take at most,
+            by default None.
+        beam_size : Optional[int], optional
+            The beam size overriding the one of the profile,
+            by default None.
+
+        Returns
+        -------
+        tuple[str, DecodingProfile]
+            The name of the selected profile and its settings.
+        """
+        name, resolved = select_profile(
+            profile,
+            audio_seconds,
+            device=self.__device,
+            calibration=self.__calibration,
+            cpu_threads=self.__cpu_threads,
+            target_rtf=self.__target_rtf,
+            deadline_seconds=deadline_seconds,
+        )
+        if beam_size is not None:
+            resolved = dataclasses.replace(resolved, beam_size=beam_size)
+        return name, resolved
+
+    def calibrate(self, fixture_path: str) -> Calibration:
         """
+        Benchmark the decoding profiles on this host.
 
-        # Load the model
-        self.model = WhisperModel(
-            model_size_or_path="large-v2" if device == "cuda" else "base",
-            device=device,
-            compute_type="int8_float16" if device == "cuda" else "int8",
+        Every profile is run on the fixture with a few thread counts,
+        and the fastest thread count and its real-time factor are kept.
+
+        Parameters
+        ----------
+        fixture_path : str
+            The path to a short audio or video file with speech.
+
+        Returns
+        -------
+        Calibration
+            The real-time factor and the thread count of each profile.
+        """
+        pcm = self.__decode_audio(fixture_path)
+        audio_seconds = len(pcm) / SAMPLING_RATE
+
+        if self.__device == "cuda":
+            thread_counts = [0]
+        elif self.__cpu_threads > 0:
+            thread_counts = [self.__cpu_threads]
+        else:
+            cpu_count = os.cpu_count() or 1
+            thread_counts = sorted({max(1, cpu_count // 2), cpu_count})
+
+        real_time_factors: dict[str, float] = {}
+        cpu_threads: dict[str, int] = {}
+        for name in PROFILE_NAMES:
+            for threads in thread_counts:
+                profile = dataclasses.replace(
+                    DEFAULT_PROFILES[self.__device][name], cpu_threads=threads
+                )
+                model = self.__load_model(profile, cache=False)
+
+                # warm up on a few seconds, the first call is slower
+                self.__transcribe(model, pcm[: 5 * SAMPLING_RATE], profile=profile)
+
+                started = time.perf_counter()
+                self.__transcribe(model, pcm, profile=profile)
+                rtf = (time.perf_counter() - started) / audio_seconds
+
+                logging.info(f"profile '{name}' with {threads} threads: RTF {rtf:.3f}")
+                if rtf < real_time_factors.get(name, float("inf")):
+                    real_time_factors[name] = rtf
+                    cpu_threads[name] = threads
+
+        return Calibration(
+            device=self.__device,
+            real_time_factors=real_time_factors,
             cpu_threads=cpu_threads,
-            num_workers=num_workers,
         )
 
     def convert_and_transcribe(
@@ -49,7 +249,12 @@ class Transcriber:
         audio_or_video_file_path: str,
         *,
         prompt: str = "",
-        beam_size: int = 5,
+        profile: str = "balanced",
+        deadline_seconds: Optional[float] = None,
+        language: Optional[str] = None,
+        remove_input: bool = False,
+        on_input_removed: Optional[Callable[[], None]] = None,
+        beam_size: Optional[int] = None,
     ) -> TranscribeData:
         """
         Transcribe an audio or video file.
@@ -61,70 +266,361 @@ class Transcriber:
         prompt : str, optional
             The initial prompt to make the model easier to understand
             the context, by default "".
-        beam_size : int, optional
-            The beam size to use for beam search, by default 5.
+        profile : str, optional
+            The decoding profile, "speed", "balanced", "accurate" or
+            "auto" to pick one from the audio length, by default "balanced".
+        deadline_seconds : Optional[float], optional
+            The time the transcription should take at most, considered
+            by the "auto" profile, by default None.
+        language : Optional[str], optional
+            The language spoken in the audio, e.g. "ja",
+            by default None (detected).
+        remove_input : bool, optional
+            Whether to remove the input file as soon as it is decoded,
+            by default False.
+        on_input_removed : Optional[Callable[[], None]], optional
+            The function called once the input file is removed and its
+            space is freed, by default None.
+        beam_size : Optional[int], optional
+            The beam size overriding the one of the profile,
+            by default None.
 
         Returns
         -------
         TranscribeData
             The transcribed text and the timeline of the audio file.
         """
-        # Extract or convert audio from input file if it is a .mp3 file
-        audio_file_path = self.__convert_to_audio(audio_or_video_file_path)
+        with tracer.start_as_current_span(
+            "convert_and_transcribe",
+            {
+                "file.bytes": os.path.getsize(audio_or_video_file_path),
+                "streaming": False,
+            },
+        ) as span:
+            # Decode the input file into 16kHz mono PCM once,
+            # both whisper and the diarizer read the same buffer
+            with tracer.start_as_current_span("decode_audio"):
+                pcm = self.__decode_audio(audio_or_video_file_path)
+            if remove_input:
+                os.remove(audio_or_video_file_path)
+                if on_input_removed is not None:
+                    on_input_removed()
 
-        # Transcribe the audio file
-        return self.__transcribe(
-            audio_file_path=audio_file_path, prompt=prompt, beam_size=beam_size
-        )
+            profile_name, decoding_profile = self.resolve_profile(
+                profile,
+                len(pcm) / SAMPLING_RATE,
+                deadline_seconds=deadline_seconds,
+                beam_size=beam_size,
+            )
+            span.set_attributes(
+                {
+                    "audio.seconds": len(pcm) / SAMPLING_RATE,
+                    "whisper.profile": profile_name,
+                    "whisper.model": decoding_profile.model_size,
+                    "whisper.compute_type": decoding_profile.compute_type,
+                }
+            )
 
-    def __transcribe(
+            # Diarize on a worker thread while whisper decodes.
+            # Both ctranslate2 and numpy release the GIL in their heavy parts,
+            # so the diarization is mostly hidden behind the decoding.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                turns_future = (
+                    executor.submit(propagate(self.__diarize), pcm)
+                    if self.__diarizer is not None
+                    else None
+                )
+
+                if language is None:
+                    language, _ = self.detect_language(pcm, profile=decoding_profile)
+                segments = self.transcribe(
+                    pcm, prompt=prompt, profile=decoding_profile, language=language
+                )
+
+                if turns_future is None:
+                    return TranscribeData.from_segments(segments)
+                turns = turns_future.result()
+
+            return TranscribeData.from_segments(
+                [
+                    Segment(
+                        start=segment.start,
+                        end=segment.end,
+                        text=segment.text,
+                        speaker=assign_speaker(segment.start, segment.end, turns),
+                    )
+                    for segment in segments
+                ]
+            )
+
+    def transcribe(
         self,
-        audio_file_path: str,
+        pcm: np.ndarray,
         *,
         prompt: str = "",
-        beam_size: int = 5,
-    ) -> TranscribeData:
+        profile: DecodingProfile,
+        language: Optional[str] = None,
+    ) -> list[Segment]:
         """
-        Transcribe an audio file.
+        Transcribe decoded audio.
 
         Parameters
         ----------
-        audio_file_path : str
-            The path to the audio file.
+        pcm : np.ndarray
+            16kHz mono float32 PCM.
         prompt : str, optional
             The initial prompt to make the model easier to understand
             the context, by default "".
+        profile : DecodingProfile
+            The decoding settings, see `resolve_profile`.
+        language : Optional[str], optional
+            The language spoken in the audio, by default None
+            (detected by whisper on the first 30 seconds).
 
         Returns
         -------
-        TranscribeData
-            The transcribed text and the timeline of the audio file.
+        list[Segment]
+            The transcribed segments.
         """
-        segments, info = self.model.transcribe(
-            audio_file_path, initial_prompt=prompt, beam_size=beam_size
-        )
+        with tracer.start_as_current_span(
+            "whisper.transcribe",
+            {
+                "audio.seconds": len(pcm) / SAMPLING_RATE,
+                "whisper.model": profile.model_size,
+                "whisper.beam_size": profile.beam_size,
+            },
+        ) as span:
+            segments = self.__transcribe(
+                self.__load_model(profile),
+                pcm,
+                prompt=prompt,
+                profile=profile,
+                language=language,
+            )
+            span.set_attribute("whisper.segments", len(segments))
+            return segments
+
+    def detect_language(
+        self,
+        pcm: np.ndarray,
+        *,
+        profile: DecodingProfile,
+        cache: bool = True,
+    ) -> tuple[str, float]:
+        """
+        Detect the language spoken in decoded audio.
+
+        Whisper detects the language on the first 30 seconds, which go
+        wrong on recordings starting with music or silence. Instead,
+        the detection runs on speech sampled by VAD, and the result is
+        cached per audio so that the same recording is never detected
+        twice.
 
+        Parameters
+        ----------
+        pcm : np.ndarray
+            16kHz mono float32 PCM.
+        profile : DecodingProfile
+            The decoding settings, whose model is used for detection.
+        cache : bool, optional
+            Whether to look up and store the result in the cache,
+            by default True.
+
+        Returns
+        -------
+        tuple[str, float]
+            The detected language and its probability.
+        """
+        with tracer.start_as_current_span("detect_language") as span:
+            language, probability = self.__detect_language(
+                pcm, profile=profile, cache=cache
+            )
+            span.set_attributes(
+                {"language": language, "language.probability": probability}
+            )
+            return language, probability
+
+    def __detect_language(
+        self, pcm: np.ndarray, *, profile: DecodingProfile, cache: bool
+    ) -> tuple[str, float]:
+        scanned = pcm[: LANGUAGE_SCAN_SECONDS * SAMPLING_RATE]
+
+        # the scanned part and the length identify the audio well enough,
+        # without hashing hours of PCM
+        digest = hashlib.sha256(np.ascontiguousarray(scanned))
+        digest.update(str(len(pcm)).encode("utf-8"))
+        key = digest.hexdigest()
+        if cache:
+            cached = self.__language_cache.get(key)
+            if cached is not None:
+                logging.info("Cached language '%s' with probability %f" % tuple(cached))
+                return cached[0], cached[1]
+
+        # the segments are generated lazily, only the detection is run
+        _, info = self.__load_model(profile).transcribe(
+            self.__sample_speech(scanned), beam_size=1
+        )
         logging.info(
             "Detected language '%s' with probability %f"
             % (info.language, info.language_probability)
         )
 
-        transcripts: list[str] = []
-        timelines: list[str] = []
-        for segment in segments:
-            timeline = f"[{int(segment.start // 60)}m{int(segment.start % 60)}s -> {int(segment.end // 60)}m{int(segment.end % 60)}s] **{segment.text.strip()}**"
-            logging.info(timeline)
+        if cache:
+            self.__language_cache.set(key, [info.language, info.language_probability])
+        return info.language, info.language_probability
+
+    def __diarize(self, pcm: np.ndarray) -> list[SpeakerTurn]:
+        with tracer.start_as_current_span("diarize") as span:
+            turns = self.__diarizer(pcm, SAMPLING_RATE)
+            span.set_attribute("diarize.speakers", len({t.speaker for t in turns}))
+            return turns
+
+    def __transcribe(
+        self,
+        model: WhisperModel,
+        pcm: np.ndarray,
+        *,
+        prompt: str = "",
+        profile: DecodingProfile,
+        language: Optional[str] = None,
+    ) -> list[Segment]:
+        """
+        Transcribe decoded audio with the given model.
 
-            timelines.append(timeline)
-            transcripts.append(segment.text)
+        Parameters
+        ----------
+        model : WhisperModel
+            The model to transcribe with.
+        pcm : np.ndarray
+            16kHz mono float32 PCM.
+        prompt : str, optional
+            The initial prompt to make the model easier to understand
+            the context, by default "".
+        profile : DecodingProfile
+            The decoding settings.
+        language : Optional[str], optional
+            The language spoken in the audio, by default None.
 
-        return TranscribeData(
-            timeline="\n\n".join(timelines), transcript="\n".join(transcripts)
+        Returns
+        -------
+        list[Segment]
+            The transcribed segments.
+        """
+        segments, info = model.transcribe(
+            pcm,
+            language=language,
+            initial_prompt=prompt,
+            beam_size=profile.beam_size,
+            best_of=profile.best_of,
+            temperature=list(profile.temperature),
         )
 
-    def __convert_to_audio(self, audio_or_video_file_path: str) -> str:
+        if language is None:
+            logging.info(
+                "Detected language '%s' with probability %f"
+                % (info.language, info.language_probability)
+            )
+
+        results: list[Segment] = []
+        for segment in segments:
+            result = Segment(start=segment.start, end=segment.end, text=segment.text)
+            logging.info(result.to_timeline())
+
+            results.append(result)
+
+        return results
+
+    def __load_model(
+        self, profile: DecodingProfile, *, cache: bool = True
+    ) -> WhisperModel:
+        """
+        Load the model of a profile, or get it from the loaded ones.
+
+        Parameters
+        ----------
+        profile : DecodingProfile
+            The decoding settings.
+        cache : bool, optional
+            Whether to keep the model for later use, by default True.
+
+        Returns
+        -------
+        WhisperModel
+            The model.
+        """
+        key = (profile.model_size, profile.compute_type, profile.cpu_threads)
+        with self.__models_lock:
+            if key in self.__models:
+                self.__models.move_to_end(key)
+                return self.__models[key]
+
+            future = self.__loading.get(key)
+            if future is None:
+                future = Future()
+                self.__loading[key] = future
+                loading = True
+            else:
+                loading = False
+
+        if not loading:
+            return future.result()
+
+        try:
+            logging.info(f"loading whisper model {key}.")
+            model = WhisperModel(
+                model_size_or_path=profile.model_size,
+                device=self.__device,
+                compute_type=profile.compute_type,
+                cpu_threads=profile.cpu_threads,
+                num_workers=self.__num_workers,
+            )
+        except BaseException as e:
+            with self.__models_lock:
+                del self.__loading[key]
+            future.set_exception(e)
+            raise
+
+        with self.__models_lock:
+            del self.__loading[key]
+            if cache:
+                self.__models[key] = model
+                while len(self.__models) > self.__max_models:
+                    unloaded, _ = self.__models.popitem(last=False)
+                    logging.info(f"unloading whisper model {unloaded}.")
+        future.set_result(model)
+        return model
+
+    def __sample_speech(self, pcm: np.ndarray) -> np.ndarray:
+        """
+        Collect up to 30 seconds of speech from decoded audio.
+
+        Parameters
+        ----------
+        pcm : np.ndarray
+            16kHz mono float32 PCM.
+
+        Returns
+        -------
+        np.ndarray
+            The speech, or the beginning of the audio if VAD found none.
         """
-        Extract audio from a video file and save it as an mp3 file.
+        limit = LANGUAGE_DETECTION_SECONDS * SAMPLING_RATE
+
+        chunks: list[np.ndarray] = []
+        total = 0
+        for timestamp in get_speech_timestamps(pcm):
+            chunks.append(pcm[timestamp["start"] : timestamp["end"]][: limit - total])
+            total += len(chunks[-1])
+            if total >= limit:
+                break
+
+        if not chunks:
+            return pcm[:limit]
+        return np.concatenate(chunks)
+
+    def __decode_audio(self, audio_or_video_file_path: str) -> np.ndarray:
+        """
+        Decode the audio stream of an audio or video file.
 
         Parameters
         ----------
@@ -133,11 +629,7 @@ class Transcriber:
 
         Returns
         -------
-        str
-            The path to the output mp3 file.
+        np.ndarray
+            16kHz mono float32 PCM.
         """
-        audio = AudioSegment.from_file(audio_or_video_file_path)
-        audio_file_path = audio_or_video_file_path.rsplit(".", 1)[0] + ".mp3"
-        audio.export(audio_file_path, format="mp3")
-
-        return audio_file_path
+        return decode_audio(audio_or_video_file_path, sampling_rate=SAMPLING_RATE)
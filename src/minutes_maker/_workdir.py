@@ -0,0 +1,256 @@
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from ._tracing import tracer
+
+INSTANCE_PREFIX = "minutes-maker-"
+
+
+class WorkDirFullError(RuntimeError):
+    """
+    Raised when a job cannot get space in the work directories in time.
+    """
+
+
+class WorkDir:
+    """
+    The directory of a job, and the space reserved for it.
+    """
+
+    def __init__(self, path: str, release: Callable[[], None]) -> None:
+        """
+        Initialize the work directory.
+
+        Parameters
+        ----------
+        path : str
+            The path of the directory.
+        release : Callable[[], None]
+            The function to give the reserved space back with.
+        """
+        self.path = path
+        self.__release = release
+        self.__released = False
+        self.__lock = threading.Lock()
+
+    def release(self) -> None:
+        """
+        Give the reserved space back, e.g. once the input file of the job
+        is removed. Only the first call counts, from any thread.
+        """
+        with self.__lock:
+            if self.__released:
+                return
+            self.__released = True
+        self.__release()
+
+
+class WorkDirManager:
+    """
+    Manage the per-job work directories of the server.
+
+    Every job gets a fresh directory, which is removed as soon as the job
+    is done. Small jobs are placed in `tmpfs_dir` (e.g. `/dev/shm`) when
+    given, the others in `disk_dir`. The total size reserved by running
+    jobs is bounded by `quota_bytes`: jobs that do not fit wait until
+    running jobs finish or give their space back, and fail after
+    `admission_timeout` seconds.
+
+    The directories of this process live under an instance directory
+    guarded by an exclusive lock, which the OS releases even if the
+    process crashes, so leftovers of dead processes are recognized and
+    swept when a new manager starts.
+    """
+
+    def __init__(
+        self,
+        disk_dir: Optional[str] = None,
+        *,
+        tmpfs_dir: Optional[str] = None,
+        tmpfs_threshold_bytes: int = 64 * 1024**2,
+        quota_bytes: Optional[int] = None,
+        admission_timeout: float = 60.0,
+    ) -> None:
+        """
+        Initialize the manager and sweep leftovers of dead processes.
+
+        Parameters
+        ----------
+        disk_dir : Optional[str], optional
+            The directory to place jobs in, by default None
+            (`minutes-maker` in the system temporary directory).
+        tmpfs_dir : Optional[str], optional
+            The memory-backed directory to place small jobs in,
+            by default None (always use `disk_dir`).
+        tmpfs_threshold_bytes : int, optional
+            The maximum size of a job placed in `tmpfs_dir`,
+            by default 64 MiB.
+        quota_bytes : Optional[int], optional
+            The maximum total size of the running jobs,
+            by default None (unlimited).
+        admission_timeout : float, optional
+            How long a job waits for space, by default 60.0 seconds.
+        """
+        self.__disk_dir = disk_dir or os.path.join(
+            tempfile.gettempdir(), "minutes-maker"
+        )
+        self.__tmpfs_dir = tmpfs_dir
+        self.__tmpfs_threshold_bytes = tmpfs_threshold_bytes
+        self.__quota_bytes = quota_bytes
+        self.__admission_timeout = admission_timeout
+
+        # only used on the event loop, see `job`
+        self.__reserved_bytes = 0
+        self.__condition = asyncio.Condition()
+
+        self.__instance_id = f"{INSTANCE_PREFIX}{uuid.uuid4().hex}"
+        self.__locks: list[int] = []
+        for root in self.__roots():
+            os.makedirs(root, exist_ok=True)
+            self.sweep(root)
+
+            # keep the lock open (and held) for the lifetime of the process
+            lock = os.open(
+                os.path.join(root, f"{self.__instance_id}.lock"),
+                os.O_CREAT | os.O_RDWR,
+            )
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.__locks.append(lock)
+            os.makedirs(os.path.join(root, self.__instance_id))
+
+    @staticmethod
+    def sweep(root: str) -> None:
+        """
+        Remove the work directories left by dead processes.
+
+        Parameters
+        ----------
+        root : str
+            The directory holding the instance directories.
+        """
+        for entry in os.listdir(root):
+            if not (entry.startswith(INSTANCE_PREFIX) and entry.endswith(".lock")):
+                continue
+
+            lock_path = os.path.join(root, entry)
+            lock = os.open(lock_path, os.O_RDWR)
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # the owner is alive
+                os.close(lock)
+                continue
+
+            instance_dir = os.path.join(root, entry.removesuffix(".lock"))
+            logging.info(f"removing leftover work directory {instance_dir}.")
+            shutil.rmtree(instance_dir, ignore_errors=True)
+            os.remove(lock_path)
+            os.close(lock)
+
+    @asynccontextmanager
+    async def job(self, size: int) -> AsyncIterator[WorkDir]:
+        """
+        Reserve space for a job and create its directory.
+
+        Jobs wait for space on the event loop, so that waiting jobs do not
+        take the worker threads the running jobs need to finish. The
+        directory and everything in it is removed when the context exits,
+        whether the job succeeded or not.
+
+        Parameters
+        ----------
+        size : int
+            The number of bytes the job will write.
+
+        Yields
+        ------
+        WorkDir
+            The job directory.
+
+        Raises
+        ------
+        WorkDirFullError
+            If the job is larger than the quota, or the space could not
+            be reserved within the admission timeout.
+        """
+        await self.__reserve(size)
+        try:
+            root = self.__disk_dir
+            if (
+                self.__tmpfs_dir is not None
+                and size <= self.__tmpfs_threshold_bytes
+                # tmpfs is backed by memory, never fill it up
+                and shutil.disk_usage(self.__tmpfs_dir).free > 2 * size
+            ):
+                root = self.__tmpfs_dir
+
+            job_dir = tempfile.mkdtemp(
+                prefix="job-", dir=os.path.join(root, self.__instance_id)
+            )
+        except BaseException:
+            await self.__release(size)
+            raise
+
+        # the space may be given back early, from the thread of the job
+        loop = asyncio.get_running_loop()
+        work_dir = WorkDir(
+            job_dir,
+            lambda: asyncio.run_coroutine_threadsafe(self.__release(size), loop),
+        )
+        try:
+            yield work_dir
+        finally:
+            # a job holds a single file, removing it is quick
+            shutil.rmtree(job_dir, ignore_errors=True)
+            work_dir.release()
+
+    async def __reserve(self, size: int) -> None:
+        if self.__quota_bytes is None:
+            return
+        if size > self.__quota_bytes:
+            raise WorkDirFullError(
+                f"the file ({size} bytes) is larger than the disk quota "
+                f"({self.__quota_bytes} bytes)."
+            )
+
+        with tracer.start_as_current_span(
+            "workdir.admission", {"file.bytes": size}
+        ) as span:
+            async with self.__condition:
+                span.set_attribute(
+                    "workdir.waited",
+                    self.__reserved_bytes + size > self.__quota_bytes,
+                )
+                try:
+                    await asyncio.wait_for(
+                        self.__condition.wait_for(
+                            lambda: self.__reserved_bytes + size <= self.__quota_bytes
+                        ),
+                        self.__admission_timeout,
+                    )
+                except TimeoutError:
+                    raise WorkDirFullError(
+                        "the server is busy, no disk space became available "
+                        f"within {self.__admission_timeout} seconds."
+                    )
+                self.__reserved_bytes += size
+
+    async def __release(self, size: int) -> None:
+        if self.__quota_bytes is None:
+            return
+        async with self.__condition:
+            self.__reserved_bytes -= size
+            self.__condition.notify_all()
+
+    def __roots(self) -> list[str]:
+        if self.__tmpfs_dir is None:
+            return [self.__disk_dir]
+        return [self.__disk_dir, self.__tmpfs_dir]
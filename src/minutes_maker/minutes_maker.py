@@ -1,17 +1,23 @@
 import logging
 import subprocess
-from typing import Literal, Union
+import warnings
+from typing import Callable, Literal, Optional, Union
 
 from dotenv import load_dotenv
 
+from ._backends import BatchingBackend, LLMBackend, LocalBackend, OpenAIBackend
+from ._diarizer import Diarizer
+from ._live import LiveSession
+from ._profiles import Calibration
 from ._prompts import (
     EnglishLecturePrompts,
     EnglishMeetingPrompts,
     JapaneseLecturePrompts,
     JapaneseMeetingPrompts,
 )
+from ._streaming import StreamingTranscriber
 from ._summarizer import Summarizer
-from ._transcriber import Transcriber
+from ._transcriber import LANGUAGE_CODES, Transcriber
 
 load_dotenv()
 
@@ -25,6 +31,16 @@ class MinutesMaker:
         *,
         cpu_threads: int = 0,
         num_workers: int = 1,
+        diarize: bool = True,
+        cache_dir: Optional[str] = None,
+        llm_api_base: Optional[str] = None,
+        llm_batch_size: int = 1,
+        max_context_length: Optional[int] = None,
+        max_generation_length: Optional[int] = None,
+        calibration_file: Optional[str] = None,
+        target_rtf: float = 1.0,
+        memory_budget_mb: Optional[int] = None,
+        max_models: int = 2,
     ) -> None:
         """
         Initialize the MinutesMaker class with a Summarizer and
@@ -33,7 +49,7 @@ class MinutesMaker:
         Parameters
         ----------
         model : str, optional
-            The OpenAI model to be used for summarization,
+            The model to be used for summarization,
             by default "gpt-3.5-turbo-16k-0613".
         cpu_threads : int, optional
             The number of CPU threads to use for inference,
@@ -41,22 +57,74 @@ class MinutesMaker:
         num_workers : int, optional
             The number of workers to use for inference,
             by default 1 (non-parallel).
+        diarize : bool, optional
+            Whether to label the timeline with speakers,
+            by default True.
+        cache_dir : Optional[str], optional
+            The directory to persist condensed transcripts and
+            detected languages to, by default None (kept in memory only).
+        llm_api_base : Optional[str], optional
+            The base URL of a local OpenAI-compatible server to summarize
+            with, by default None (OpenAI API).
+        llm_batch_size : int, optional
+            The maximum number of LLM requests of concurrent jobs
+            sent together, by default 1 (no batching).
+        max_context_length : Optional[int], optional
+            The number of transcript tokens sent to the LLM at once,
+            by default None (guessed from the model name).
+        max_generation_length : Optional[int], optional
+            The maximum number of tokens generated by an LLM call,
+            by default None (half of `max_context_length`, at most 3000).
+        calibration_file : Optional[str], optional
+            The calibration written by `calibrate`,
+            by default None (built-in decoding profiles only).
+        target_rtf : float, optional
+            The real-time factor the "auto" decoding profile aims at,
+            by default 1.0.
+        memory_budget_mb : Optional[int], optional
+            The memory budget of the audio pipeline in MiB. When given,
+            files are decoded and transcribed chunk by chunk, so that
+            the memory used does not grow with the length of the file,
+            by default None (the whole file is decoded at once).
+        max_models : int, optional
+            The number of whisper models kept loaded, by default 2.
         """
-        self.__summarizer = Summarizer(model=model)
+        backend: LLMBackend = (
+            OpenAIBackend(model=model)
+            if llm_api_base is None
+            else LocalBackend(model=model, api_base=llm_api_base)
+        )
+        if llm_batch_size > 1:
+            backend = BatchingBackend(backend, max_batch_size=llm_batch_size)
+
+        self.__summarizer = Summarizer(
+            backend=backend,
+            max_context_length=max_context_length,
+            max_generation_length=max_generation_length,
+            cache_dir=cache_dir,
+        )
+        diarizer = Diarizer() if diarize else None
         self.__transcriber = Transcriber(
             device="cuda" if self.__check_cuda() else "cpu",
             cpu_threads=cpu_threads,
             num_workers=num_workers,
+            diarizer=diarizer,
+            calibration=Calibration.load(calibration_file)
+            if calibration_file is not None
+            else None,
+            target_rtf=target_rtf,
+            cache_dir=cache_dir,
+            max_models=max_models,
+        )
+        self.__file_transcriber: Union[Transcriber, StreamingTranscriber] = (
+            self.__transcriber
+            if memory_budget_mb is None
+            else StreamingTranscriber(
+                self.__transcriber,
+                memory_budget_mb=memory_budget_mb,
+                diarizer=diarizer,
+            )
         )
-
-        # Somehow cannot extend the Enum class,
-        # we cannot make base class for prompts.
-        self.__prompts: Union[
-            JapaneseLecturePrompts,
-            JapaneseMeetingPrompts,
-            EnglishLecturePrompts,
-            EnglishMeetingPrompts,
-        ] = None
 
     def __call__(
         self,
@@ -65,7 +133,12 @@ class MinutesMaker:
         category: Literal["meeting", "lecture"] = "meeting",
         content: str = "",
         *,
-        beam_size: int = 5,
+        profile: str = "balanced",
+        deadline_seconds: Optional[float] = None,
+        source_language: Optional[str] = None,
+        remove_input: bool = False,
+        on_input_removed: Optional[Callable[[], None]] = None,
+        beam_size: Optional[int] = None,
     ) -> tuple[str, str]:
         """
         Transcribe and summarize an audio or video file.
@@ -75,7 +148,7 @@ class MinutesMaker:
         audio_or_video_file_path : str
             The path to the audio or video file to be summarized.
         language : Literal["ja", "en"], optional
-            The language of the text to be summarized,
+            The language of the summary,
             by default "ja".
         category : Literal["meeting", "lecture"], optional
             The type of the audio to be summarized,
@@ -84,43 +157,193 @@ class MinutesMaker:
             The content of the audio or video file to be summarized.
             e.g. 商品開発, engineering, etc.
             by default "".
-        beam_size : int, optional
-            The beam size to use for inference,
-            by default 5.
+        profile : str, optional
+            The decoding profile, "speed", "balanced", "accurate" or
+            "auto" to pick one from the audio length, by default "balanced".
+        deadline_seconds : Optional[float], optional
+            The time the transcription should take at most, considered
+            by the "auto" profile, by default None.
+        source_language : Optional[str], optional
+            The language spoken in the audio or video file, e.g. "en",
+            by default None (detected).
+        remove_input : bool, optional
+            Whether to remove the audio or video file as soon as
+            it is decoded, by default False.
+        on_input_removed : Optional[Callable[[], None]], optional
+            The function called once the audio or video file is removed
+            and its space is freed, by default None.
+        beam_size : Optional[int], optional
+            Deprecated, use `profile` instead. The beam size overriding
+            the one of the profile, by default None.
 
         Returns
         -------
         tuple[str, str]
             The transcribed timeline and its summary.
         """
-        if language == "ja":
-            if category == "meeting":
-                self.__prompts = JapaneseMeetingPrompts
-            elif category == "lecture":
-                self.__prompts = JapaneseLecturePrompts
-            else:
-                raise ValueError(
-                    f"category must be either 'meeting' or 'lecture', but got {category}."
-                )
-        elif language == "en":
-            if category == "meeting":
-                self.__prompts = EnglishMeetingPrompts
-            elif category == "lecture":
-                self.__prompts = EnglishLecturePrompts
-            else:
-                raise ValueError(
-                    f"category must be either 'meeting' or 'lecture', but got {category}."
-                )
+        prompts = self.__select_prompts(language, category)
+        self.__check_source_language(source_language)
+        if beam_size is not None:
+            warnings.warn(
+                "beam_size is deprecated, use profile instead.",
+                DeprecationWarning,
+                stacklevel=2,
+            )
 
-        results = self.__transcriber.convert_and_transcribe(
+        results = self.__file_transcriber.convert_and_transcribe(
             audio_or_video_file_path,
-            prompt=self.__prompts.TRANSCRIBE_FORMAT.value.format(content=content),
+            prompt=prompts.TRANSCRIBE_FORMAT.value.format(content=content),
+            profile=profile,
+            deadline_seconds=deadline_seconds,
+            language=source_language,
+            remove_input=remove_input,
+            on_input_removed=on_input_removed,
             beam_size=beam_size,
         )
         return results.timeline, self.__summarizer.summarize(
-            results.transcript, prompts=self.__prompts
+            results.transcript, prompts=prompts
+        )
+
+    def live_session(
+        self,
+        language: Literal["ja", "en"] = "ja",
+        category: Literal["meeting", "lecture"] = "meeting",
+        content: str = "",
+        *,
+        encoding: Literal["pcm_s16le", "opus"] = "pcm_s16le",
+        sample_rate: int = 16000,
+        profile: str = "balanced",
+        source_language: Optional[str] = None,
+    ) -> LiveSession:
+        """
+        Start transcribing a live audio stream.
+
+        The timeline of a live session has no speaker labels,
+        since diarization needs the whole recording.
+
+        Parameters
+        ----------
+        language : Literal["ja", "en"], optional
+            The language of the text to be summarized,
+            by default "ja".
+        category : Literal["meeting", "lecture"], optional
+            The type of the audio to be summarized,
+            by default "meeting"
+        content : str, optional
+            The content of the audio to be summarized.
+            e.g. 商品開発, engineering, etc.
+            by default "".
+        encoding : Literal["pcm_s16le", "opus"], optional
+            The encoding of the audio frames, by default "pcm_s16le".
+        sample_rate : int, optional
+            The sampling rate of the audio frames, by default 16000.
+        profile : str, optional
+            The decoding profile, by default "balanced".
+        source_language : Optional[str], optional
+            The language spoken in the stream, e.g. "en",
+            by default None (detected).
+
+        Returns
+        -------
+        LiveSession
+            The session to feed the audio frames to.
+        """
+        self.__check_source_language(source_language)
+        return LiveSession(
+            self.__transcriber,
+            self.__summarizer,
+            self.__select_prompts(language, category),
+            content,
+            encoding=encoding,
+            sample_rate=sample_rate,
+            profile=profile,
+            language=source_language,
         )
 
+    def calibrate(self, fixture_path: str) -> Calibration:
+        """
+        Benchmark the decoding profiles on this host.
+
+        Parameters
+        ----------
+        fixture_path : str
+            The path to a short audio or video file with speech.
+
+        Returns
+        -------
+        Calibration
+            The real-time factor and the thread count of each profile,
+            to be saved and passed back as `calibration_file`.
+        """
+        return self.__transcriber.calibrate(fixture_path)
+
+    def __select_prompts(
+        self,
+        language: Literal["ja", "en"],
+        category: Literal["meeting", "lecture"],
+    ) -> Union[
+        JapaneseLecturePrompts,
+        JapaneseMeetingPrompts,
+        EnglishLecturePrompts,
+        EnglishMeetingPrompts,
+    ]:
+        """
+        Select the prompts for the given language and category.
+
+        The prompts are not kept on the instance,
+        since concurrent requests may ask for different ones.
+
+        Parameters
+        ----------
+        language : Literal["ja", "en"]
+            The language of the summary.
+        category : Literal["meeting", "lecture"]
+            The type of the audio.
+
+        Returns
+        -------
+        Union[
+            JapaneseLecturePrompts,
+            JapaneseMeetingPrompts,
+            EnglishLecturePrompts,
+            EnglishMeetingPrompts
+        ]
+            The prompts.
+        """
+        if category not in ("meeting", "lecture"):
+            raise ValueError(
+                f"category must be either 'meeting' or 'lecture', but got {category}."
+            )
+
+        if language == "ja":
+            if category == "meeting":
+                return JapaneseMeetingPrompts
+            return JapaneseLecturePrompts
+        elif language == "en":
+            if category == "meeting":
+                return EnglishMeetingPrompts
+            return EnglishLecturePrompts
+        else:
+            raise ValueError(
+                f"language must be either 'ja' or 'en', but got {language}."
+            )
+
+    def __check_source_language(self, source_language: Optional[str]) -> None:
+        """
+        Check that whisper knows the language spoken in the audio, before
+        any decoding starts.
+
+        Parameters
+        ----------
+        source_language : Optional[str]
+            The language spoken in the audio, None to detect it.
+        """
+        if source_language is not None and source_language not in LANGUAGE_CODES:
+            raise ValueError(
+                "source_language must be a language code of whisper, e.g. 'en', "
+                f"but got {source_language}."
+            )
+
     def __check_cuda(self) -> bool:
         """
         Check if CUDA is available.
@@ -52,7 +52,6 @@ const FileUploader: React.FC<FileUploaderProps> = ({
       setApiResponse(null); // Reset the API response
       const formData = new FormData(); // Create a new FormData instance
       formData.append("file", file); // Append the file
-      formData.append("filename", file.name); // Append the filename
       formData.append("language", language); // Append the language
       formData.append("category", category); // Append the audio type
       formData.append("content", content); // Append the content